@@ -0,0 +1,86 @@
+"""
+Durable high-watermark checkpoint for incremental detector runs.
+
+The checkpoint records the newest ingested Loki timestamp (ns), hashes of the
+lines sitting exactly on that timestamp (so re-fetching from the watermark does
+not double count them), and the tail of lines that did not yet fill a complete
+WINDOW_SIZE window. The next run fetches only the delta since the watermark and
+prepends the tail, so windows continue where the previous run stopped.
+
+Environment variables:
+ - CHECKPOINT_PATH (default /tmp/detector_checkpoint.json; empty disables checkpointing)
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+from logbatch import LogBatch
+
+CHECKPOINT_PATH = os.environ.get("CHECKPOINT_PATH", "/tmp/detector_checkpoint.json")
+
+def line_hash(line):
+    return hashlib.sha1(line.encode("utf-8", "surrogatepass")).hexdigest()
+
+def load_checkpoint(path=None):
+    """
+    Return the stored checkpoint dict, or None if missing, disabled or unreadable.
+    """
+    path = CHECKPOINT_PATH if path is None else path
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            ckpt = json.load(f)
+        ckpt["last_ts_ns"] = int(ckpt["last_ts_ns"])
+        ckpt["boundary_hashes"] = set(ckpt.get("boundary_hashes", []))
+        ckpt["tail"] = LogBatch.from_entries((int(ts), line) for ts, line in ckpt.get("tail", []))
+        return ckpt
+    except Exception as e:
+        print("Ignoring unreadable checkpoint:", e)
+        return None
+
+def drop_seen(batch, ckpt):
+    """
+    Drop rows of `batch` at or before the checkpoint watermark that were already ingested.
+    """
+    if not ckpt or not len(batch):
+        return batch
+    last_ts = ckpt["last_ts_ns"]
+    seen = ckpt["boundary_hashes"]
+    keep = batch.ts > last_ts
+    for i in np.nonzero(batch.ts == last_ts)[0]:
+        keep[i] = line_hash(batch.line(i)) not in seen
+    return batch if keep.all() else batch.take(np.nonzero(keep)[0])
+
+def save_checkpoint(batch, tail_start, previous=None, path=None):
+    """
+    Atomically persist the watermark, boundary hashes and window tail for `batch`
+    (the sorted LogBatch processed by this run). `tail_start` is the index of the
+    first line the next run needs, i.e. the start of the first unfinished window.
+    """
+    path = CHECKPOINT_PATH if path is None else path
+    if not path:
+        return
+    last_ts = previous["last_ts_ns"] if previous else None
+    hashes = set(previous["boundary_hashes"]) if previous else set()
+    if len(batch) and (last_ts is None or int(batch.ts[-1]) > last_ts):
+        last_ts = int(batch.ts[-1])
+        hashes = set()
+    if last_ts is None:
+        return
+    hashes.update(line_hash(batch.line(i)) for i in np.nonzero(batch.ts == last_ts)[0])
+    ckpt = {
+        "last_ts_ns": last_ts,
+        "boundary_hashes": sorted(hashes),
+        "tail": batch.slice(tail_start).entries(),
+    }
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(ckpt, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except Exception as e:
+        print("Failed to write checkpoint:", e)
@@ -2,7 +2,7 @@
 AI-Ops Detector:
  - Queries Loki for the last N minutes of logs for job=app
  - Builds sliding-window features from recent log lines
- - Uses IsolationForest to detect anomalous windows
+ - Uses IsolationForest (or a lighter DETECTOR_ENGINE) to detect anomalous windows
  - Alerts Slack, and auto-remediates by creating GH issue or writing remediation log
 
 Environment variables:
@@ -14,15 +14,63 @@ Environment variables:
  - WINDOW_SIZE (number of lines per window, default 50)
  - WINDOW_STEP (sliding step, default 25)
  - CONTAMINATION (IsolationForest contamination param, default 0.05)
+ - LOKI_PAGE_SIZE (lines per query_range page, default 1000)
+ - LOKI_MAX_LINES (total line budget per query, default 200000)
+ - LOKI_MAX_BYTES (total byte budget per query, default 67108864)
+ - LOKI_SHARDS (number of time shards fetched concurrently, default 1; with the segment cache
+   enabled the cache's segments are the units fetched concurrently instead)
+ - LOKI_FETCH_WORKERS (max concurrent shard or segment fetches, default 4; each may hold up to
+   the remaining line/byte budget)
+ - DETECTOR_MODE (batch: one run over the query range; stream: tail Loki continuously; default batch)
+ - STREAM_INTERVAL_SECONDS (seconds between detection passes in stream mode, default 10)
+ - FEATURE_SOURCE (lines: featurize raw lines; logql: let Loki aggregate per-step metrics; default lines)
+ - LOG_SOURCE (loki: query Loki; file: tail LOG_FILE_PATH directly, see filetail.py; default loki)
+ - UNIQUE_MODE (exact: sliding distinct counter; hll: HyperLogLog estimate for very large windows; default exact)
+ - TEMPLATE_MINING (1 to tag every line with a mined template id, see templates.py; default 0)
+ - FEATURE_MODE (basic: the 4 hand-built window features; templates: sparse per-window template counts; default basic)
+ - WINDOW_MODE (lines: WINDOW_SIZE-line windows; time: WINDOW_SECONDS time buckets with rate features;
+   pyramid: multi-resolution time windows, see pyramid.py; default lines)
+ - WINDOW_SECONDS (time window width, default 30)
+ - WINDOW_HOP_SECONDS (time window hop, default WINDOW_SECONDS)
+ - PYRAMID_LEVELS (WINDOW_MODE=pyramid: comma-separated window widths in seconds, each a
+   multiple of the first, all derived from one pass over the finest buckets; default 10,60,300,900).
+   The query range is widened by the coarsest level so its windows are complete.
+ - FIELD_PATTERNS (numeric fields whose per-window p50/p99/max become features, see fields.py;
+   default none)
+ - FEATURE_DROP (comma-separated features to leave out; per-feature cost is printed after each run, see feature_registry.py)
+ - DETECTOR_ENGINE (iforest: IsolationForest; hst: streaming Half-Space Trees that keep learning
+   from every new window, see hstrees.py; robust: rolling median/MAD z-scores with EWMA control
+   limits in pure NumPy, see robust.py; default iforest). scikit-learn is only imported for
+   iforest and sparse template features; the Dockerfile's REQUIREMENTS=requirements-light.txt
+   build arg leaves it out for hst or robust.
+ - MODEL_PATH (trained model to score with instead of fitting per run, see train.py; default /tmp/detector_model.joblib)
+ - MODEL_REGISTRY_DIR (versioned trained models; the current one is hot-reloaded between
+   scoring batches and takes precedence over MODEL_PATH, see model_store.py; default /tmp/detector_models)
+ - FEATURE_STORE_DIR (where every run's window features are kept, see feature_store.py; empty disables)
 """
 
 import os
 import time
-import requests
+import threading
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from sklearn.ensemble import IsolationForest
+from scipy import sparse
 from datetime import datetime, timedelta
 import dateutil.parser
+import http_client
+import checkpoint
+import loki_decode
+import segment_cache
+import windowing
+import distinct
+import pyramid
+import fields
+import feature_store
+import feature_registry
+import model_store
+from logbatch import LogBatch
 
 LOKI_URL = os.environ.get("LOKI_URL", "http://loki:3100")
 SLACK_WEBHOOK = os.environ.get("SLACK_WEBHOOK")
@@ -34,72 +82,550 @@ WINDOW_SIZE = int(os.environ.get("WINDOW_SIZE", "50"))
 WINDOW_STEP = int(os.environ.get("WINDOW_STEP", "25"))
 CONTAMINATION = float(os.environ.get("CONTAMINATION", "0.05"))
 
-def query_loki_for_lines(job="app", minutes=10):
+LOKI_PAGE_SIZE = int(os.environ.get("LOKI_PAGE_SIZE", "1000"))
+LOKI_MAX_LINES = int(os.environ.get("LOKI_MAX_LINES", "200000"))
+LOKI_MAX_BYTES = int(os.environ.get("LOKI_MAX_BYTES", str(64 * 1024 * 1024)))
+LOKI_SHARDS = int(os.environ.get("LOKI_SHARDS", "1"))
+LOKI_FETCH_WORKERS = int(os.environ.get("LOKI_FETCH_WORKERS", "4"))
+
+DETECTOR_MODE = os.environ.get("DETECTOR_MODE", "batch")
+DETECTOR_ENGINE = os.environ.get("DETECTOR_ENGINE", "iforest")
+STREAM_INTERVAL_SECONDS = float(os.environ.get("STREAM_INTERVAL_SECONDS", "10"))
+FEATURE_SOURCE = os.environ.get("FEATURE_SOURCE", "lines")
+LOG_SOURCE = os.environ.get("LOG_SOURCE", "loki")
+UNIQUE_MODE = os.environ.get("UNIQUE_MODE", "exact")
+TEMPLATE_MINING = os.environ.get("TEMPLATE_MINING", "0") == "1"
+FEATURE_MODE = os.environ.get("FEATURE_MODE", "basic")
+WINDOW_MODE = os.environ.get("WINDOW_MODE", "lines")
+WINDOW_SECONDS = int(os.environ.get("WINDOW_SECONDS", "30"))
+WINDOW_HOP_SECONDS = int(os.environ.get("WINDOW_HOP_SECONDS", str(WINDOW_SECONDS)))
+PYRAMID_LEVELS = pyramid.parse_levels(os.environ.get("PYRAMID_LEVELS", "10,60,300,900"))
+
+# column names of the LogQL metric features (see logql_features.py)
+BASIC_FEATURE_NAMES = ["avg_len", "error_count", "warn_count", "unique_messages"]
+
+class FetchBudget:
     """
-    Query Loki for lines from now - minutes -> now for job label.
-    Returns list of (timestamp_iso, line).
+    Line/byte budget (LOKI_MAX_LINES / LOKI_MAX_BYTES) of one fetch, so the
+    lines held in memory stay bounded however the range is split: time shards
+    and cache segments each fetch within what is left of it (remaining) and
+    are charged to it in time order (see _fetch_in_order). `cut_ns` is the
+    timestamp of the first entry that did not fit; entries from there on are
+    dropped from the result, which therefore stays a gap-free prefix of the
+    range.
+    """
+
+    def __init__(self, max_lines=None, max_bytes=None, report=True):
+        self.max_lines = max_lines or LOKI_MAX_LINES
+        self.max_bytes = max_bytes or LOKI_MAX_BYTES
+        self.report = report
+        self.lines = 0
+        self.bytes = 0
+        self.cut_ns = None
+        self._lock = threading.Lock()
+
+    @property
+    def exhausted(self):
+        return self.cut_ns is not None
+
+    def take(self, ts, sizes):
+        """
+        Charge entries with timestamps `ts` and byte sizes `sizes`, in order;
+        returns how many of them fit.
+        """
+        cum = np.cumsum(sizes, dtype=np.int64)
+        with self._lock:
+            n = min(len(cum), self.max_lines - self.lines,
+                    int(np.searchsorted(cum, self.max_bytes - self.bytes, side="right")))
+            n = max(n, 0)
+            self.lines += n
+            self.bytes += int(cum[n - 1]) if n else 0
+        if n < len(cum):
+            self.stop(int(ts[n]))
+        return n
+
+    def remaining(self):
+        """
+        A new budget of what is left of this one.
+        """
+        with self._lock:
+            lines = max(1, self.max_lines - self.lines)
+            nbytes = max(1, self.max_bytes - self.bytes)
+        return FetchBudget(lines, nbytes, report=False)
+
+    def stop(self, ts_ns):
+        """
+        Mark everything from ts_ns on as not fetched.
+        """
+        with self._lock:
+            if self.cut_ns is None and self.report:
+                print(f"Loki fetch budget reached ({self.lines} lines, {self.bytes} bytes); truncating range.")
+            self.cut_ns = ts_ns if self.cut_ns is None else min(self.cut_ns, ts_ns)
+
+    def cut(self, batch):
+        """
+        Drop the entries of a sorted batch from cut_ns on.
+        """
+        if self.cut_ns is None:
+            return batch
+        return batch.slice(0, int(np.searchsorted(batch.ts, self.cut_ns, side="left")))
+
+def _fetch_range(query, start_ns, end_ns, page_size, budget):
+    """
+    Page query_range forward over [start_ns, end_ns) within `budget`.
+    Returns (LogBatch, complete); complete is False when the budget cut it short.
+    """
+    url = f"{LOKI_URL}/loki/api/v1/query_range"
+    parts = []
+    cursor = start_ns
+    boundary = set()  # entries already returned at timestamp == cursor
+    while cursor < end_ns:
+        if budget.exhausted:
+            # another shard or segment spent the budget; nothing from here on is kept
+            budget.stop(cursor)
+            return LogBatch.concat(parts), False
+        params = {
+            "query": query,
+            "limit": page_size,
+            "start": cursor,
+            "end": end_ns,
+            "direction": "forward",
+        }
+        with http_client.get(url, endpoint="loki.query_range", params=params, timeout=10, stream=True) as r:
+            r.raise_for_status()
+            # decode (ts_ns, line) pairs straight off the socket instead of r.json()
+            page = list(loki_decode.iter_query_range_values(r.iter_content(chunk_size=64 * 1024)))
+        page.sort(key=lambda x: x[0])
+        fresh = LogBatch.from_entries([e for e in page if e not in boundary])
+        # charge UTF-8 bytes, like the tail, segment cache and file paths
+        taken = budget.take(fresh.ts, fresh.byte_lengths())
+        parts.append(fresh if taken == len(fresh) else fresh.slice(0, taken))
+        if taken < len(fresh):
+            return LogBatch.concat(parts), False
+        if len(page) < page_size:
+            break
+        last_ts = page[-1][0]
+        if last_ts == cursor and not len(fresh):
+            # A full page of identical timestamps we have already seen; step past it.
+            cursor += 1
+            boundary = set()
+            continue
+        if last_ts != cursor:
+            boundary = set()
+        boundary.update(e for e in page if e[0] == last_ts)
+        cursor = last_ts
+    return LogBatch.concat(parts), True
+
+def fetch_loki_range(query, start_ns, end_ns, page_size=None, max_lines=None, max_bytes=None, budget=None):
+    """
+    Fetch every entry of `query` in [start_ns, end_ns) by paging query_range forward.
+
+    Each page resumes from the last returned timestamp; entries at that boundary
+    timestamp which were already returned are dropped so nothing is counted twice.
+    Stops when a short page is returned or the line/byte budget (`budget`, or a
+    new FetchBudget of max_lines/max_bytes) is spent.
+    Returns a LogBatch sorted by timestamp.
+    """
+    budget = budget or FetchBudget(max_lines, max_bytes)
+    return budget.cut(_fetch_range(query, start_ns, end_ns, page_size or LOKI_PAGE_SIZE, budget)[0])
+
+def split_time_range(start_ns, end_ns, shards):
+    """
+    Split [start_ns, end_ns) into up to `shards` contiguous, non-overlapping ranges.
+    """
+    shards = max(1, min(shards, end_ns - start_ns))
+    bounds = [start_ns + (end_ns - start_ns) * i // shards for i in range(shards + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(shards) if bounds[i] < bounds[i + 1]]
+
+def _fetch_in_order(jobs, workers, budget):
+    """
+    Run `jobs` — callables fetching consecutive, ascending time ranges within
+    the FetchBudget they are given and returning (LogBatch, complete) — on a
+    pool of `workers` threads, and charge their batches to `budget` in time
+    order. Each job may spend all that is left of the budget when it starts,
+    so a burst in one range keeps as much as a single unsplit fetch would;
+    at most `workers` jobs run ahead of the one being charged, which bounds
+    memory. Once the budget is spent, running jobs are stopped and the rest
+    are never started. Returns the merged LogBatch, a prefix of the ranges.
     """
+    jobs = list(jobs)
+    parts, pending, i = [], deque(), 0
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as pool:
+        while i < len(jobs) or pending:
+            while i < len(jobs) and len(pending) < max(1, workers):
+                share = budget.remaining()
+                pending.append((share, pool.submit(jobs[i], share)))
+                i += 1
+            share, future = pending.popleft()
+            batch, complete = future.result()
+            taken = budget.take(batch.ts, batch.byte_lengths())
+            parts.append(batch if taken == len(batch) else batch.slice(0, taken))
+            if not complete and not budget.exhausted:
+                # the job spent exactly what was left here; the rest of its range is missing
+                budget.stop(share.cut_ns)
+            if budget.exhausted:
+                for share, future in pending:
+                    future.cancel()
+                    share.stop(budget.cut_ns)
+                break
+    # ranges are disjoint and ascending, so concatenation is already the k-way merge;
+    # sort() is a no-op check unless Loki returned something out of order
+    return budget.cut(LogBatch.concat(parts).sort())
+
+def fetch_loki_sharded(query, start_ns, end_ns, shards=None, workers=None, budget=None):
+    """
+    Fetch [start_ns, end_ns) as `shards` time slices on a bounded thread pool and
+    merge the per-shard batches, each already sorted by timestamp, within one
+    line/byte budget (see _fetch_in_order), so sharding never keeps less than
+    one unsharded fetch.
+    Returns a LogBatch sorted by timestamp.
+    """
+    shards = shards or LOKI_SHARDS
+    workers = workers or LOKI_FETCH_WORKERS
+    budget = budget or FetchBudget()
+    ranges = split_time_range(start_ns, end_ns, shards)
+    if len(ranges) <= 1:
+        return fetch_loki_range(query, start_ns, end_ns, budget=budget)
+    jobs = [partial(_fetch_range, query, s, e, LOKI_PAGE_SIZE) for s, e in ranges]
+    return _fetch_in_order(jobs, workers, budget)
+
+_segment_cache = None
+
+def get_segment_cache():
+    global _segment_cache
+    if _segment_cache is None:
+        _segment_cache = segment_cache.SegmentCache()
+    return _segment_cache
+
+_feature_store = None
+
+def feature_context():
+    """
+    How feature rows are made beyond their column names. Rows (and models)
+    with equal names but another source or windowing are not comparable:
+    avg_len is bytes per LogQL step but characters per line window.
+    """
+    if FEATURE_SOURCE == "logql":
+        import logql_features
+        return {"source": "logql", "step_seconds": logql_features.METRIC_STEP_SECONDS}
+    context = {"source": "lines", "window_mode": WINDOW_MODE}
+    if WINDOW_MODE == "lines":
+        context.update(window_size=WINDOW_SIZE, window_step=WINDOW_STEP)
+    elif WINDOW_MODE == "time":
+        context.update(window_seconds=WINDOW_SECONDS, window_hop_seconds=WINDOW_HOP_SECONDS)
+    return context
+
+def get_feature_store():
+    global _feature_store
+    if _feature_store is None:
+        _feature_store = feature_store.FeatureStore(context=feature_context())
+    return _feature_store
+
+def fetch_loki_cached(query, start_ns, end_ns, cache, workers=None, budget=None):
+    """
+    Fetch [start_ns, end_ns) segment by segment: closed segments are served from
+    the on-disk cache (or fetched whole and stored on a miss), the still-open
+    tail is always fetched from Loki. Segments take the place of shards here:
+    they are read and fetched on a bounded thread pool and charged to one
+    line/byte budget in time order (see _fetch_in_order), so LOKI_SHARDS does
+    not apply; once the budget is spent no further segment is requested.
+    Returns a LogBatch sorted by timestamp.
+    """
+    workers = workers or LOKI_FETCH_WORKERS
+    budget = budget or FetchBudget()
+    todo = []
+    for seg in cache.segments(start_ns, end_ns):
+        if cache.is_closed(seg):
+            todo.append((seg, seg + cache.segment_ns, True))
+        else:
+            todo.append((max(seg, start_ns), min(seg + cache.segment_ns, end_ns), False))
+
+    def in_range(batch):
+        lo, hi = np.searchsorted(batch.ts, [start_ns, end_ns], side="left")
+        return batch.slice(int(lo), int(hi))
+
+    def fetch(s, e, closed, share):
+        if closed:
+            cached = cache.get(query, s)
+            if cached is not None:
+                return in_range(cached), True
+        batch, complete = _fetch_range(query, s, e, LOKI_PAGE_SIZE, share)
+        # never cache a segment the line/byte budget truncated
+        if closed and complete:
+            cache.put(query, s, batch)
+        # only lines of the requested range are charged to the budget
+        return in_range(batch), complete
+
+    return _fetch_in_order([partial(fetch, *item) for item in todo], workers, budget)
+
+def fetch_loki(query, start_ns, end_ns, budget=None):
+    """
+    Fetch [start_ns, end_ns) through the segment cache when enabled, otherwise
+    as concurrent time shards, within `budget` (default a new FetchBudget).
+    """
+    cache = get_segment_cache()
+    if cache.enabled:
+        return fetch_loki_cached(query, start_ns, end_ns, cache, budget=budget)
+    return fetch_loki_sharded(query, start_ns, end_ns, budget=budget)
+
+def _query_range_ns(minutes):
     end = datetime.utcnow()
     start = end - timedelta(minutes=minutes)
-    # Convert to RFC3339 or nanoseconds? Loki accepts RFC3339 for start/end params. Use RFC3339.
-    params = {
-        "query": '{job="app"}',
-        "limit": 1000,
-        "start": int(start.timestamp() * 1e9),  # nanoseconds
-        "end": int(end.timestamp() * 1e9),
-    }
-    url = f"{LOKI_URL}/loki/api/v1/query_range"
+    if WINDOW_MODE == "pyramid":
+        # a pyramid row needs the coarsest level's history before it, so fetch
+        # that much more to still score the whole range
+        start -= timedelta(seconds=PYRAMID_LEVELS[-1])
+    # Loki accepts nanosecond epoch timestamps for start/end.
+    return int(start.timestamp() * 1e9), int(end.timestamp() * 1e9)
+
+def query_loki_for_lines(job="app", minutes=10):
+    """
+    Query Loki for lines from now - minutes -> now for job label.
+    Returns a LogBatch sorted by timestamp.
+    """
+    start_ns, end_ns = _query_range_ns(minutes)
     try:
-        r = requests.get(url, params=params, timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        lines = []
-        for stream in data.get("data", {}).get("result", []):
-            for ts, line in stream.get("values", []):
-                # ts is nanoseconds as string — convert
-                ts_ns = int(ts)
-                ts_s = ts_ns / 1e9
-                ts_iso = datetime.utcfromtimestamp(ts_s).isoformat() + "Z"
-                lines.append((ts_iso, line))
-        # sort by timestamp
-        lines.sort(key=lambda x: x[0])
-        return lines
+        return fetch_loki(f'{{job="{job}"}}', start_ns, end_ns)
     except Exception as e:
         print("Error querying loki:", e)
-        return []
+        return LogBatch.empty()
 
-def feature_extraction_from_lines(lines):
+def query_loki_incremental(ckpt, job="app", minutes=10):
     """
-    Build sliding windows from raw lines and extract numeric features for each window.
+    Query Loki only for lines newer than the checkpoint watermark (bounded by the
+    last `minutes`) and prepend the checkpoint's unfinished window tail.
+    Returns a LogBatch sorted by timestamp.
+    """
+    start_ns, end_ns = _query_range_ns(minutes)
+    tail = LogBatch.empty()
+    if ckpt and ckpt["last_ts_ns"] >= start_ns:
+        start_ns = ckpt["last_ts_ns"]
+        tail = ckpt["tail"]
+    try:
+        batch = fetch_loki(f'{{job="{job}"}}', start_ns, end_ns)
+    except Exception as e:
+        print("Error querying loki:", e)
+        batch = LogBatch.empty()
+    return LogBatch.concat([tail, checkpoint.drop_seen(batch, ckpt)])
+
+def read_log_file_incremental(ckpt, minutes=10):
+    """
+    Read lines appended to the local app log since the persisted file offset
+    (bounded by the last `minutes`) and prepend the checkpoint's window tail.
+    Returns (LogBatch, new file state); the state is persisted by the caller
+    once the batch has been processed.
+    """
+    import filetail
+    start_ns, _ = _query_range_ns(minutes)
+    batch, state = filetail.read_new_batch(filetail.load_offset(), min_ts_ns=start_ns)
+    tail = ckpt["tail"] if ckpt and ckpt["last_ts_ns"] >= start_ns else LogBatch.empty()
+    return LogBatch.concat([tail, batch]), state
 
-    For each window:
-      - avg_length: average line length
-      - error_count: number of lines containing 'ERROR'
-      - warn_count: number of lines containing 'WARN'
-      - unique_messages: count of unique messages (simple proxy for diversity)
+def mine_templates(batch):
     """
-    texts = [ln for _, ln in lines]
-    n = len(texts)
+    Tag every line of `batch` with its template id (int32 "template_id" column)
+    using the persisted template miner, so ids stay stable across runs.
+    """
+    import templates
+    miner = templates.load_miner()
+    known = len(miner)
+    t0 = time.perf_counter()
+    miner.assign(batch)
+    elapsed = time.perf_counter() - t0
+    templates.save_miner(miner)
+    print(f"Mined {len(batch)} lines into {len(miner)} templates ({len(miner) - known} new) in {elapsed:.2f}s.")
+    return miner
+
+def feature_windows(batch):
+    """
+    Line index bounds of every window of `batch` under WINDOW_MODE.
+    Returns (starts, ends, next_start); lines from next_start on are needed by
+    the next run to finish the current partial window.
+    """
+    if WINDOW_MODE == "time":
+        starts, ends, _, next_start = windowing.time_window_bounds(
+            batch.ts, WINDOW_SECONDS * 1_000_000_000, WINDOW_HOP_SECONDS * 1_000_000_000
+        )
+        return starts, ends, next_start
+    if WINDOW_MODE == "pyramid":
+        return pyramid.pyramid_windows(batch.ts, PYRAMID_LEVELS)
+    n = len(batch)
     if n == 0:
-        return np.empty((0, 4))
-    windows = []
-    for start in range(0, max(1, n - WINDOW_SIZE + 1), max(1, WINDOW_STEP)):
-        window = texts[start:start + WINDOW_SIZE]
-        lengths = [len(x) for x in window]
-        avg_length = float(np.mean(lengths)) if lengths else 0.0
-        error_count = sum(1 for x in window if "ERROR" in x or "Error" in x)
-        warn_count = sum(1 for x in window if "WARN" in x or "Warning" in x)
-        unique_messages = len(set(window))
-        windows.append([avg_length, error_count, warn_count, unique_messages])
-    return np.array(windows)
-
-def detect_anomalies(features):
-    """
-    Fit IsolationForest on features and detect which windows are anomalous.
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, 0
+    starts, ends = windowing.window_bounds(n, WINDOW_SIZE, WINDOW_STEP)
+    return starts, ends, windowing.next_window_start(n, WINDOW_SIZE, WINDOW_STEP)
+
+def feature_window_bounds(batch):
+    """
+    (n_windows, 2) int64 [start, end) time bounds in ns of every window of
+    feature_windows(batch): bucket bounds for time windows, first/last line
+    timestamps for line windows.
+    """
+    if WINDOW_MODE == "time":
+        width_ns = WINDOW_SECONDS * 1_000_000_000
+        _, _, t, _ = windowing.time_window_bounds(batch.ts, width_ns, WINDOW_HOP_SECONDS * 1_000_000_000)
+        return np.column_stack([t, t + width_ns])
+    if WINDOW_MODE == "pyramid":
+        return np.column_stack(pyramid.pyramid_times(batch.ts, PYRAMID_LEVELS))
+    if not len(batch):
+        return np.empty((0, 2), dtype=np.int64)
+    starts, ends, _ = feature_windows(batch)
+    return np.column_stack([batch.ts[starts], batch.ts[ends - 1] + 1])
+
+def store_features(features, names, bounds):
+    """
+    Append dense window features and their time bounds to the feature store;
+    sparse template counts are not stored.
+    """
+    store = get_feature_store()
+    if not store.enabled or sparse.issparse(features) or not features.shape[0]:
+        return
+    n = store.append(names, features, bounds)
+    print(f"Stored {n} feature rows in {store.directory}.")
+
+def _line_lengths(windows):
+    return windows.shared("char_lengths", windowing.char_lengths)
+
+def _severity(windows):
+    return windows.shared("severity", windowing.severity_flags)
+
+def _window_sizes(windows):
+    return windows.ends - windows.starts
+
+def _avg_len(windows):
+    sizes = _window_sizes(windows)
+    lengths = windowing.window_sums(_line_lengths(windows), windows.starts, windows.ends)
+    return np.divide(lengths, sizes, out=np.zeros(len(sizes)), where=sizes > 0)
+
+def _error_count(windows):
+    return windowing.window_sums(_severity(windows)[0], windows.starts, windows.ends)
+
+def _warn_count(windows):
+    return windowing.window_sums(_severity(windows)[1], windows.starts, windows.ends)
+
+def _unique_messages(windows):
+    ids = windows.shared("line_ids", distinct.line_ids)
+    if UNIQUE_MODE == "hll":
+        return distinct.hll_window_counts(ids, windows.starts, windows.ends)
+    return distinct.sliding_distinct_counts(ids, windows.starts, windows.ends)
+
+_feature_registry = None
+
+def get_feature_registry():
+    """
+    The features of the current WINDOW_MODE, followed by one p50/p99/max block
+    per FIELD_PATTERNS field:
+      - lines: avg_len, error_count (ERROR/CRITICAL lines by parsed level, see
+        logformat.py), warn_count (WARNING lines), unique_messages
+      - time: the same as rates — lines_per_sec, avg_len (0 for an empty
+        window), errors_per_sec, warns_per_sec, uniq — so a burst and a quiet
+        period are distinguishable
+      - pyramid: the multi-resolution block of pyramid.py
+    """
+    global _feature_registry
+    if _feature_registry is not None:
+        return _feature_registry
+    registry = feature_registry.FeatureRegistry()
+    if WINDOW_MODE == "time":
+        registry.register("lines_per_sec", lambda w: _window_sizes(w) / WINDOW_SECONDS)
+        registry.register("avg_len", _avg_len)
+        registry.register("errors_per_sec", lambda w: _error_count(w) / WINDOW_SECONDS)
+        registry.register("warns_per_sec", lambda w: _warn_count(w) / WINDOW_SECONDS)
+        registry.register("uniq", _unique_messages)
+    elif WINDOW_MODE == "pyramid":
+        registry.register(
+            "pyramid", lambda w: pyramid.build_pyramid(w.batch, PYRAMID_LEVELS), columns=pyramid.feature_names(PYRAMID_LEVELS)
+        )
+    else:
+        registry.register("avg_len", _avg_len)
+        registry.register("error_count", _error_count)
+        registry.register("warn_count", _warn_count)
+        registry.register("unique_messages", _unique_messages)
+    for pattern in fields.parse_patterns(fields.FIELD_PATTERNS):
+        registry.register(
+            pattern[0],
+            lambda w, pattern=pattern: fields.field_window_features(w.batch, w.starts, w.ends, [pattern]),
+            columns=fields.feature_names([pattern[0]]),
+        )
+    _feature_registry = registry
+    return registry
+
+def build_features(batch):
+    """
+    Featurize a LogBatch according to FEATURE_MODE.
+    Returns (features, names, miner): features is the dense windows x columns
+    matrix of the feature registry for "basic" and a CSR windows x templates
+    matrix for "templates" (names None); miner is None unless templates were mined.
+    """
+    miner = None
+    if TEMPLATE_MINING or FEATURE_MODE == "templates":
+        miner = mine_templates(batch)
+    starts, ends, _ = feature_windows(batch)
+    if FEATURE_MODE == "templates":
+        import template_features
+        return template_features.template_count_matrix(batch.columns["template_id"], starts, ends, len(miner)), None, miner
+    features, names = get_feature_registry().build(feature_registry.Windows(batch, starts, ends))
+    return features, names, miner
+
+_schema_mismatch_reported = False
+_streaming_engine = None
+
+def new_streaming_engine():
+    if DETECTOR_ENGINE == "robust":
+        import robust
+        return robust.RobustDetector(contamination=CONTAMINATION)
+    import hstrees
+    return hstrees.HalfSpaceTrees(contamination=CONTAMINATION)
+
+def get_streaming_engine(names):
+    """
+    The streaming engine (DETECTOR_ENGINE=hst or robust) for these feature
+    columns, resumed from ENGINE_STATE_PATH when it was saved for the same
+    columns, feature context and engine.
+    """
+    global _streaming_engine
+    if _streaming_engine is None or _streaming_engine[0] != names:
+        engine = new_streaming_engine()
+        saved = model_store.load_engine_state(names, context=feature_context())
+        if type(saved) is type(engine):
+            engine = saved
+        _streaming_engine = (list(names), engine)
+    return _streaming_engine[1]
+
+def detect_anomalies(features, names=None, fresh=None):
+    """
+    Detect which windows are anomalous. With a trained model for these feature
+    columns and feature_context() (see train.py and model_store.py) the
+    windows are only scored.
+    Otherwise DETECTOR_ENGINE=hst or robust scores the `fresh` windows
+    (boolean mask, default all) with the streaming engine and then learns from
+    them, and the default engine fits an IsolationForest on the windows themselves.
     Returns indices of anomalous windows.
     """
+    global _schema_mismatch_reported
+    if not sparse.issparse(features) and features.shape[0]:
+        # one model per call: a registry swap only affects the next batch
+        trained = model_store.current_model()
+        if trained is not None and trained.matches(names, feature_context()):
+            preds = trained.predict(features)
+            return [i for i, p in enumerate(preds) if p == -1]
+        if trained is not None and not _schema_mismatch_reported:
+            _schema_mismatch_reported = True
+            print("Trained model was built for other feature columns or windowing; fitting on each run instead.")
+        if DETECTOR_ENGINE in ("hst", "robust"):
+            names = names or [f"f{i}" for i in range(features.shape[1])]
+            rows = np.arange(features.shape[0]) if fresh is None else np.flatnonzero(fresh)
+            if not len(rows):
+                return []  # no window completed since the last pass
+            engine = get_streaming_engine(names)
+            preds = engine.partial_fit_predict(features[rows])
+            model_store.save_engine_state(engine, names, context=feature_context())
+            return [int(i) for i in rows[preds == -1]]
     if features.shape[0] < 3:
         return []  # not enough samples for a model
+    from sklearn.ensemble import IsolationForest
+    # IsolationForest takes the CSR template counts as they are
     model = IsolationForest(contamination=CONTAMINATION, random_state=42)
     preds = model.fit_predict(features)
     anomalies = [i for i, p in enumerate(preds) if p == -1]
@@ -111,7 +637,7 @@ def send_slack_alert(text):
         return
     payload = {"text": f"🚨 AI-Ops Anomaly detected:\n{text}"}
     try:
-        r = requests.post(SLACK_WEBHOOK, json=payload, timeout=5)
+        r = http_client.post(SLACK_WEBHOOK, endpoint="slack.webhook", json=payload, timeout=5)
         r.raise_for_status()
         print("Slack alert sent.")
     except Exception as e:
@@ -127,7 +653,7 @@ def auto_remediate(summary):
         headers = {"Authorization": f"token {GITHUB_TOKEN}"}
         payload = {"title": "AI-Ops: Anomaly detected — auto remediation", "body": summary}
         try:
-            r = requests.post(url, json=payload, headers=headers, timeout=10)
+            r = http_client.post(url, endpoint="github.issues", json=payload, headers=headers, timeout=10)
             r.raise_for_status()
             issue = r.json()
             print("Created GitHub issue:", issue.get("html_url"))
@@ -144,28 +670,133 @@ def auto_remediate(summary):
         print("Failed to write remediation log:", e)
         return None
 
-def summarize_anomalies(anomalies, features):
+def summarize_anomalies(anomalies, features, names=None, miner=None):
     parts = []
+    if sparse.issparse(features):
+        import template_features
+        for idx in anomalies:
+            top = template_features.top_templates(features, idx)
+            desc = ", ".join(f"{count}x '{miner.template(tid) if miner else tid}'" for tid, count in top)
+            parts.append(f"window#{idx}: top templates: {desc}")
+        return "\n".join(parts)
+    names = names or [f"f{i}" for i in range(features.shape[1])]
     for idx in anomalies:
-        feats = features[idx]
-        parts.append(f"window#{idx}: avg_len={feats[0]:.1f}, errors={int(feats[1])}, warns={int(feats[2])}, uniq={int(feats[3])}")
+        desc = ", ".join(f"{name}={value:.4g}" for name, value in zip(names, features[idx]))
+        parts.append(f"window#{idx}: {desc}")
     return "\n".join(parts)
 
+def fresh_windows(batch, offset, seen_total, seen_ts):
+    """
+    Mask of the windows of `batch` the previous streaming pass did not score.
+    That pass saw `seen_total` lines in all, the last at `seen_ts`; `offset`
+    is the global index of batch's first line. Line windows are fresh when
+    they hold a line past seen_total. Time and pyramid windows are only
+    emitted once a later line closes them, so they are fresh when they end
+    after seen_ts, even if the line that closed them is the first of this pass.
+    """
+    if WINDOW_MODE in ("time", "pyramid"):
+        ends = feature_window_bounds(batch)[:, 1]
+        return ends > seen_ts if seen_ts is not None else np.ones(len(ends), dtype=bool)
+    return offset + feature_windows(batch)[1] > seen_total
+
+def run_streaming(job="app"):
+    """
+    Continuously tail Loki into a ring buffer and run detection every
+    STREAM_INTERVAL_SECONDS over the buffered lines. Only anomalous windows
+    containing lines that arrived since the previous pass are alerted.
+    """
+    import stream
+    query = f'{{job="{job}"}}'
+    buffer = stream.RingBuffer()
+    start_ns, end_ns = _query_range_ns(LOG_QUERY_RANGE_MINUTES)
+    try:
+        buffer.extend(fetch_loki(query, start_ns, end_ns).entries())
+    except Exception as e:
+        print("Error querying loki:", e)
+    entries, seen_total = buffer.snapshot()
+    seen_ts = entries[-1][0] if entries else None
+    tail_start = entries[-1][0] if entries else end_ns
+    backfill = lambda q, s, e: fetch_loki_range(q, s, e).entries()
+    tailer = stream.LokiTailer(LOKI_URL, query, buffer, backfill, start_ns=tail_start,
+                               buffered=[e for e in entries if e[0] == tail_start])
+    tailer.start()
+    print(f"Streaming from Loki tail ({len(entries)} lines prefilled).")
+    try:
+        while True:
+            time.sleep(STREAM_INTERVAL_SECONDS)
+            entries, total = buffer.snapshot()
+            if total == seen_total:
+                continue
+            # global index of entries[0] in the stream of every line ever buffered
+            offset = total - len(entries)
+            batch = LogBatch.from_entries(entries)
+            features, names, miner = build_features(batch)
+            fresh = fresh_windows(batch, offset, seen_total, seen_ts)
+            anomalies = [i for i in detect_anomalies(features, names, fresh) if fresh[i]]
+            store_features(features[fresh], names, feature_window_bounds(batch)[fresh])
+            seen_total, seen_ts = total, entries[-1][0]
+            if anomalies:
+                print(f"Detected anomalies in windows: {anomalies}")
+                summary = summarize_anomalies(anomalies, features, names, miner)
+                send_slack_alert(summary)
+                rem = auto_remediate(summary)
+                print("Remediation result:", rem)
+    finally:
+        tailer.stop()
+
 def main():
     print("AI-Ops Detector starting...")
-    lines = query_loki_for_lines(minutes=LOG_QUERY_RANGE_MINUTES)
-    print(f"Queried {len(lines)} lines from Loki (last {LOG_QUERY_RANGE_MINUTES} minutes).")
-    features = feature_extraction_from_lines(lines)
+    if DETECTOR_MODE == "stream":
+        run_streaming()
+        return
+    miner = None
+    names = BASIC_FEATURE_NAMES
+    batch = ckpt = file_state = None
+    if FEATURE_SOURCE == "logql":
+        import logql_features
+        try:
+            features, times = logql_features.build_metric_features(LOKI_URL, minutes=LOG_QUERY_RANGE_MINUTES)
+        except Exception as e:
+            print("Error querying loki metrics:", e)
+            features, times = np.empty((0, 4)), np.empty(0, dtype=np.int64)
+        # each step sample covers (t - step, t]
+        step_ns = logql_features.METRIC_STEP_SECONDS * 1_000_000_000
+        bounds = np.column_stack([times * 1_000_000_000 - step_ns, times * 1_000_000_000]).astype(np.int64)
+        print(f"Queried LogQL metric features from Loki (last {LOG_QUERY_RANGE_MINUTES} minutes).")
+    elif LOG_SOURCE == "file":
+        import filetail
+        ckpt = checkpoint.load_checkpoint()
+        batch, file_state = read_log_file_incremental(ckpt, minutes=LOG_QUERY_RANGE_MINUTES)
+        print(f"Read {len(batch)} lines from {filetail.LOG_FILE_PATH}.")
+        features, names, miner = build_features(batch)
+        bounds = feature_window_bounds(batch)
+    else:
+        ckpt = checkpoint.load_checkpoint()
+        batch = query_loki_incremental(ckpt, minutes=LOG_QUERY_RANGE_MINUTES)
+        print(f"Queried {len(batch)} lines from Loki (last {LOG_QUERY_RANGE_MINUTES} minutes, incremental={ckpt is not None}).")
+        features, names, miner = build_features(batch)
+        bounds = feature_window_bounds(batch)
     print(f"Built {features.shape[0]} windows for detection.")
-    anomalies = detect_anomalies(features)
+    store_features(features, names, bounds)
+    anomalies = detect_anomalies(features, names)
     if anomalies:
         print(f"Detected anomalies in windows: {anomalies}")
-        summary = summarize_anomalies(anomalies, features)
+        summary = summarize_anomalies(anomalies, features, names, miner)
         send_slack_alert(summary)
         rem = auto_remediate(summary)
         print("Remediation result:", rem)
     else:
         print("No anomalies detected ✔️")
+    # only now are these lines scored and alerted; a run that fails before
+    # this point leaves the checkpoint alone, so the next run retries them
+    if batch is not None:
+        checkpoint.save_checkpoint(batch, feature_windows(batch)[2], previous=ckpt)
+    if file_state is not None:
+        filetail.save_offset(file_state)
+    http_client.print_latency_stats()
+    get_feature_registry().print_stats()
+    if _segment_cache is not None and _segment_cache.enabled:
+        print("Segment cache:", _segment_cache.stats())
 
 if __name__ == "__main__":
     main()
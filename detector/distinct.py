@@ -0,0 +1,143 @@
+"""
+Distinct-line counting for sliding windows.
+
+Each line is interned once to a small integer ID (identical byte strings share
+an ID). Windows are then counted either
+ - exactly, with a SlidingDistinct counter that only touches the lines entering
+   and leaving the window, so each step costs O(WINDOW_STEP); or
+ - approximately, with HyperLogLog registers built per block of lines and
+   max-merged per window, for very large windows.
+
+Environment variables:
+ - HLL_PRECISION (HyperLogLog register bits; 2**p registers, default 10)
+"""
+
+import os
+import math
+import numpy as np
+
+HLL_PRECISION = int(os.environ.get("HLL_PRECISION", "10"))
+
+def line_ids(batch):
+    """
+    Intern every line of a LogBatch to an int64 ID, hashing each line's bytes once.
+    """
+    raw = batch.data.tobytes()
+    offs = batch.offsets.tolist()
+    index = {}
+    intern = index.setdefault
+    ids = [intern(raw[a:b], len(index)) for a, b in zip(offs, offs[1:])]
+    return np.array(ids, dtype=np.int64)
+
+class SlidingDistinct:
+    """
+    Multiset of IDs with O(1) add/remove and a running distinct count.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.distinct = 0
+
+    def add(self, x):
+        c = self.counts.get(x, 0)
+        if c == 0:
+            self.distinct += 1
+        self.counts[x] = c + 1
+
+    def remove(self, x):
+        c = self.counts[x] - 1
+        if c == 0:
+            del self.counts[x]
+            self.distinct -= 1
+        else:
+            self.counts[x] = c
+
+def sliding_distinct_counts(ids, starts, ends):
+    """
+    Exact number of distinct IDs in ids[s:e] for windows with non-decreasing
+    starts and ends. Every line is added and removed at most once overall.
+    """
+    ids = ids.tolist()
+    out = np.empty(len(starts), dtype=np.int64)
+    window = SlidingDistinct()
+    lo = hi = 0
+    for k, (s, e) in enumerate(zip(starts.tolist(), ends.tolist())):
+        if s >= hi:
+            # no overlap with the previous window
+            window = SlidingDistinct()
+            lo = hi = s
+        while hi < e:
+            window.add(ids[hi])
+            hi += 1
+        while lo < s:
+            window.remove(ids[lo])
+            lo += 1
+        out[k] = window.distinct
+    return out
+
+def mix64(x):
+    """
+    splitmix64 finalizer: spread integer IDs over 64 uniformly distributed bits.
+    """
+    z = np.asarray(x).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def hll_registers(hashes, groups, n_groups, p=None):
+    """
+    HyperLogLog registers (n_groups, 2**p) uint8 for 64-bit `hashes`, where
+    hashes[i] is added to the sketch of group groups[i].
+    """
+    p = p or HLL_PRECISION
+    m = 1 << p
+    regs = np.zeros((n_groups, m), dtype=np.uint8)
+    if not len(hashes):
+        return regs
+    idx = (hashes >> np.uint64(64 - p)).astype(np.int64)
+    rest = (hashes << np.uint64(p)) | np.uint64(1 << (p - 1))  # sentinel bounds rho
+    # rho = position of the leftmost 1-bit in the remaining 64 - p bits
+    rho = np.ones(len(hashes), dtype=np.uint8)
+    probe = np.uint64(1 << 63)
+    pending = (rest & probe) == 0
+    while pending.any():
+        rho[pending] += 1
+        rest = np.where(pending, rest << np.uint64(1), rest)
+        pending &= (rest & probe) == 0
+    np.maximum.at(regs, (np.asarray(groups, dtype=np.int64), idx), rho)
+    return regs
+
+def hll_estimate(regs):
+    """
+    Cardinality estimate for each row of registers (with small-range correction).
+    """
+    regs = np.atleast_2d(regs)
+    m = regs.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.exp2(-regs.astype(np.float64)), axis=1)
+    zeros = np.count_nonzero(regs == 0, axis=1)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+def hll_window_counts(ids, starts, ends, p=None):
+    """
+    Approximate distinct counts per window: registers are built once per block
+    of gcd(window size, step) lines and each window max-merges its blocks.
+    Falls back to exact counting when windows are ragged (fewer lines than size).
+    """
+    sizes = ends - starts
+    if len(starts) == 0:
+        return np.empty(0)
+    size = int(sizes.max())
+    step = int(starts[1] - starts[0]) if len(starts) > 1 else size
+    if np.any(sizes != size) or np.any(np.diff(starts) != step):
+        return sliding_distinct_counts(ids, starts, ends).astype(float)
+    block = math.gcd(size, step)
+    n_blocks = (int(ends[-1]) - int(starts[0])) // block
+    pos = np.arange(int(starts[0]), int(starts[0]) + n_blocks * block)
+    regs = hll_registers(mix64(ids[pos]), (pos - starts[0]) // block, n_blocks, p)
+    first = (starts - starts[0]) // block
+    merged = regs[first]
+    for k in range(1, size // block):
+        np.maximum(merged, regs[first + k], out=merged)
+    return hll_estimate(merged)
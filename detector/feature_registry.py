@@ -0,0 +1,138 @@
+"""
+Registry of per-window features.
+
+A feature declares its name, dtype and a vectorized compute function
+compute(windows) -> array over the windows of a LogBatch, returning one value
+per window — or an (n_windows, k) block when it declares k column names (e.g.
+p50/p99/max of a field). A registry assembles the enabled features into the
+detector's matrix in registration order, returns the column names alongside
+it, and times every feature (and, with FEATURE_PROFILE_MEMORY=1, traces its
+peak allocation), so expensive low-value features can be found and dropped
+with FEATURE_DROP.
+
+Per-line work that several features need (line lengths, severity flags, line
+ids) is computed once per batch through Windows.shared; its cost is charged
+to the first feature that asks for it.
+
+Environment variables:
+ - FEATURE_DROP (comma-separated feature names to leave out, default none)
+ - FEATURE_PROFILE_MEMORY (1 to trace peak memory per feature with tracemalloc; default 0)
+"""
+
+import os
+import time
+import threading
+import tracemalloc
+import numpy as np
+
+FEATURE_DROP = {x.strip() for x in os.environ.get("FEATURE_DROP", "").split(",") if x.strip()}
+FEATURE_PROFILE_MEMORY = os.environ.get("FEATURE_PROFILE_MEMORY", "0") == "1"
+
+class Windows:
+    """
+    The windows [starts[k], ends[k]) of a batch being featurized, plus per-line
+    values shared between features.
+    """
+    __slots__ = ("batch", "starts", "ends", "_shared")
+
+    def __init__(self, batch, starts, ends):
+        self.batch = batch
+        self.starts = starts
+        self.ends = ends
+        self._shared = {}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def shared(self, key, compute):
+        """
+        compute(batch), evaluated once per batch under `key`.
+        """
+        if key not in self._shared:
+            self._shared[key] = compute(self.batch)
+        return self._shared[key]
+
+class Feature:
+    __slots__ = ("name", "compute", "dtype", "columns")
+
+    def __init__(self, name, compute, dtype=np.float64, columns=None):
+        self.name = name
+        self.compute = compute
+        self.dtype = np.dtype(dtype)
+        self.columns = list(columns) if columns is not None else [name]
+
+class FeatureRegistry:
+    def __init__(self, drop=None):
+        self.features = []
+        self.drop = FEATURE_DROP if drop is None else set(drop)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, compute, dtype=np.float64, columns=None):
+        """
+        Add a feature; later registrations come later in the matrix.
+        """
+        if any(f.name == name for f in self.features):
+            raise ValueError(f"feature {name!r} is already registered")
+        self.features.append(Feature(name, compute, dtype, columns))
+        return compute
+
+    def enabled(self):
+        return [f for f in self.features if f.name not in self.drop]
+
+    def names(self):
+        """
+        Column names of the assembled matrix.
+        """
+        return [col for f in self.enabled() for col in f.columns]
+
+    def build(self, windows):
+        """
+        Compute every enabled feature over `windows` and assemble the
+        (n_windows, n_columns) float64 matrix. Returns (matrix, names).
+        """
+        names = self.names()
+        out = np.empty((len(windows), len(names)))
+        col = 0
+        for f in self.enabled():
+            width = len(f.columns)
+            if FEATURE_PROFILE_MEMORY:
+                tracemalloc.start()
+            t0 = time.perf_counter()
+            values = np.asarray(f.compute(windows), dtype=f.dtype)
+            elapsed = time.perf_counter() - t0
+            peak = 0
+            if FEATURE_PROFILE_MEMORY:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            out[:, col:col + width] = values.reshape(len(windows), width)
+            col += width
+            self._record(f.name, elapsed, values.nbytes, peak)
+        return out, names
+
+    def _record(self, name, elapsed, nbytes, peak):
+        with self._lock:
+            calls, total, mx, out_bytes, peak_bytes = self._stats.get(name, (0, 0.0, 0.0, 0, 0))
+            self._stats[name] = (calls + 1, total + elapsed, max(mx, elapsed), out_bytes + nbytes, max(peak_bytes, peak))
+
+    def stats(self):
+        """
+        Return {feature: {"calls", "total_s", "avg_s", "max_s", "bytes", "peak_bytes"}};
+        bytes is the total size of the values returned, peak_bytes the largest
+        traced allocation peak (0 unless FEATURE_PROFILE_MEMORY is set).
+        """
+        with self._lock:
+            return {
+                name: {
+                    "calls": c, "total_s": total, "avg_s": total / c if c else 0.0, "max_s": mx,
+                    "bytes": nbytes, "peak_bytes": peak,
+                }
+                for name, (c, total, mx, nbytes, peak) in self._stats.items()
+            }
+
+    def print_stats(self):
+        for name, st in sorted(self.stats().items(), key=lambda kv: -kv[1]["total_s"]):
+            line = f"Feature {name}: calls={st['calls']} avg={st['avg_s'] * 1000:.1f}ms max={st['max_s'] * 1000:.1f}ms out={st['bytes'] / 1024:.0f}KiB"
+            if st["peak_bytes"]:
+                line += f" peak={st['peak_bytes'] / 1024:.0f}KiB"
+            print(line)
@@ -0,0 +1,229 @@
+"""
+Rolling on-disk store of window features.
+
+Every run appends its dense feature rows together with the [start, end) time
+bounds (ns) of their windows, so retraining, backtests and dashboards can read
+weeks of features without touching Loki. Rows are grouped by schema (the
+feature column names plus the store's context — feature source and windowing —
+since equal names can mean different things, e.g. average length in bytes per
+LogQL step vs characters per line window; both recorded in columns.json) under
+FEATURE_STORE_DIR/<schema key>/ and partitioned by the UTC day of the window
+start. Each append writes one part per day as a pair of plain .npy files
+(<write ns>.bounds.npy, <write ns>.features.npy) that reads memory-map.
+
+Overlapping runs recompute some windows, so rows are deduplicated by their
+window bounds (the last written row wins) on read. Once a day holds more than
+FEATURE_STORE_COMPACT_PARTS parts they are merged into one sorted, deduplicated
+part; a compacted day is read back as a zero-copy memory map. Days older than
+FEATURE_STORE_RETENTION_DAYS are deleted.
+
+Environment variables:
+ - FEATURE_STORE_DIR (default /tmp/detector_features; empty disables the store)
+ - FEATURE_STORE_RETENTION_DAYS (default 14)
+ - FEATURE_STORE_COMPACT_PARTS (default 8)
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import numpy as np
+
+FEATURE_STORE_DIR = os.environ.get("FEATURE_STORE_DIR", "/tmp/detector_features")
+FEATURE_STORE_RETENTION_DAYS = int(os.environ.get("FEATURE_STORE_RETENTION_DAYS", "14"))
+FEATURE_STORE_COMPACT_PARTS = int(os.environ.get("FEATURE_STORE_COMPACT_PARTS", "8"))
+
+DAY_NS = 86400 * 1_000_000_000
+
+def _day_name(day_index):
+    return str(np.datetime64(int(day_index), "D"))
+
+def _save(path, array):
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+def _dedup(features, bounds):
+    """
+    Rows sorted by window start (then end), keeping the last occurrence of
+    every [start, end): line windows can share a first timestamp.
+    """
+    order = np.lexsort((np.arange(len(bounds)), bounds[:, 1], bounds[:, 0]))
+    sorted_bounds = bounds[order]
+    last = np.r_[(sorted_bounds[1:] != sorted_bounds[:-1]).any(axis=1), True] if len(order) else np.zeros(0, dtype=bool)
+    keep = order[last]
+    return features[keep], bounds[keep]
+
+class FeatureStore:
+    def __init__(self, directory=None, retention_days=None, compact_parts=None, context=None):
+        self.directory = FEATURE_STORE_DIR if directory is None else directory
+        self.context = dict(context or {})
+        self.retention_days = FEATURE_STORE_RETENTION_DAYS if retention_days is None else retention_days
+        self.compact_parts = compact_parts or FEATURE_STORE_COMPACT_PARTS
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def _schema_dir(self, names, create=False):
+        key = "\n".join(names)
+        if self.context:
+            key += "\n" + json.dumps(self.context, sort_keys=True)
+        path = os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest()[:16])
+        if create and not os.path.exists(os.path.join(path, "columns.json")):
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, "columns.json"), "w") as f:
+                json.dump({"columns": list(names), "context": self.context}, f)
+        return path
+
+    def schemas(self):
+        """
+        (column names, context) of every schema in the store.
+        """
+        out = []
+        for key in sorted(os.listdir(self.directory)) if self.enabled else []:
+            try:
+                with open(os.path.join(self.directory, key, "columns.json")) as f:
+                    schema = json.load(f)
+            except (OSError, ValueError):
+                continue
+            # schemas written before the context was recorded are a bare column list
+            out.append((schema, {}) if isinstance(schema, list) else (schema["columns"], schema.get("context", {})))
+        return out
+
+    def days(self, names):
+        """
+        Day directory names (YYYY-MM-DD) holding rows for `names`, oldest first.
+        """
+        path = self._schema_dir(names)
+        try:
+            return sorted(d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d)))
+        except OSError:
+            return []
+
+    def parts(self, names, day):
+        """
+        Part ids of one day in write order.
+        """
+        path = os.path.join(self._schema_dir(names), day)
+        try:
+            return sorted(int(n.split(".")[0]) for n in os.listdir(path) if n.endswith(".features.npy"))
+        except OSError:
+            return []
+
+    def _part_paths(self, names, day, part):
+        base = os.path.join(self._schema_dir(names), day, str(part))
+        return f"{base}.features.npy", f"{base}.bounds.npy"
+
+    def _read_part(self, names, day, part):
+        features_path, bounds_path = self._part_paths(names, day, part)
+        return np.load(features_path, mmap_mode="r"), np.load(bounds_path, mmap_mode="r")
+
+    def append(self, names, features, bounds, now_ns=None):
+        """
+        Store feature rows (n, len(names)) with their window bounds (n, 2) int64
+        ns, then compact the touched days and apply retention.
+        Returns the number of rows written.
+        """
+        features = np.asarray(features, dtype=np.float64)
+        bounds = np.asarray(bounds, dtype=np.int64)
+        if not self.enabled or not len(features):
+            return 0
+        self._schema_dir(names, create=True)
+        day_index = bounds[:, 0] // DAY_NS
+        touched = []
+        with self._lock:
+            for day in np.unique(day_index):
+                rows = day_index == day
+                name = _day_name(day)
+                os.makedirs(os.path.join(self._schema_dir(names), name), exist_ok=True)
+                part = max([time.time_ns()] + [p + 1 for p in self.parts(names, name)])
+                features_path, bounds_path = self._part_paths(names, name, part)
+                try:
+                    # bounds first: a visible features file implies its bounds exist
+                    _save(bounds_path, bounds[rows])
+                    _save(features_path, features[rows])
+                except OSError as e:
+                    print("Failed to write feature store:", e)
+                    return 0
+                touched.append(name)
+        for name in touched:
+            if len(self.parts(names, name)) > self.compact_parts:
+                self.compact(names, name)
+        self.retain(names, now_ns)
+        return len(features)
+
+    def compact(self, names, day):
+        """
+        Merge every part of `day` into one part sorted and deduplicated by window bounds.
+        """
+        with self._lock:
+            parts = self.parts(names, day)
+            if len(parts) < 2:
+                return
+            pieces = [self._read_part(names, day, p) for p in parts]
+            features, bounds = _dedup(
+                np.concatenate([f for f, _ in pieces]), np.concatenate([b for _, b in pieces])
+            )
+            del pieces
+            # the merged part keeps the newest id, so later appends still win over it
+            features_path, bounds_path = self._part_paths(names, day, parts[-1])
+            _save(bounds_path, bounds)
+            _save(features_path, features)
+            for p in parts[:-1]:
+                for path in self._part_paths(names, day, p):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def retain(self, names, now_ns=None):
+        """
+        Delete days that ended more than retention_days ago.
+        """
+        now_ns = time.time_ns() if now_ns is None else now_ns
+        cutoff = _day_name(now_ns // DAY_NS - self.retention_days)
+        for day in self.days(names):
+            if day < cutoff:
+                shutil.rmtree(os.path.join(self._schema_dir(names), day), ignore_errors=True)
+
+    def load(self, names, start_ns=None, end_ns=None):
+        """
+        Feature rows and bounds of windows starting in [start_ns, end_ns), sorted
+        by window start. A single compacted day comes back as a read-only memory map.
+        """
+        lo = None if start_ns is None else _day_name(start_ns // DAY_NS)
+        hi = None if end_ns is None else _day_name((end_ns - 1) // DAY_NS)
+        features, bounds, compacted = [], [], True
+        for day in self.days(names):
+            if (lo and day < lo) or (hi and day > hi):
+                continue
+            parts = self.parts(names, day)
+            compacted &= len(parts) == 1
+            for part in parts:
+                f, b = self._read_part(names, day, part)
+                keep = np.ones(len(b), dtype=bool)
+                if start_ns is not None:
+                    keep &= b[:, 0] >= start_ns
+                if end_ns is not None:
+                    keep &= b[:, 0] < end_ns
+                if keep.all():
+                    features.append(f)
+                    bounds.append(b)
+                elif keep.any():
+                    # parts are sorted by start once compacted, so a range slice keeps the map
+                    idx = np.flatnonzero(keep)
+                    sl = slice(idx[0], idx[-1] + 1) if idx[-1] - idx[0] + 1 == len(idx) else idx
+                    features.append(f[sl])
+                    bounds.append(b[sl])
+        if not features:
+            return np.empty((0, len(names))), np.empty((0, 2), dtype=np.int64)
+        if len(features) == 1 and compacted:
+            return features[0], bounds[0]
+        return _dedup(np.concatenate(features), np.concatenate(bounds))
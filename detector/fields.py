@@ -0,0 +1,127 @@
+"""
+Numeric field extraction from log messages.
+
+Fields are configured as named patterns "name=prefix{}suffix", where {} stands
+for an unsigned integer or decimal, e.g. "latency_ms=in {}ms" pulls 120 out of
+"Worker 3 processed item id=4711 in 120ms". Every prefix is located with one
+vectorized scan of a LogBatch's UTF-8 buffer (windowing.find_all), the digits
+after it are parsed column-wise for all matches at once and the suffix is
+checked byte by byte, so no per-line regex or str work is done. Each field
+becomes a float64 per-line column "field_<name>" (NaN where the line has no match; the first
+match in a line wins), and per-window p50/p99/max of every field become
+detector features. Only configure magnitudes (latencies, sizes, depths):
+quantiles of an identifier such as a stage or worker number mean nothing.
+
+Environment variables:
+ - FIELD_PATTERNS (";"-separated name=prefix{}suffix patterns, e.g. "latency_ms=in {}ms";
+   default empty: no field features, so the feature schema stays that of the window mode)
+"""
+
+import os
+import numpy as np
+import windowing
+
+FIELD_PATTERNS = os.environ.get("FIELD_PATTERNS", "")
+
+FIELD_QUANTILES = [("p50", 50.0), ("p99", 99.0), ("max", 100.0)]
+
+_MAX_DIGITS = 18
+
+def parse_patterns(spec):
+    """
+    "latency_ms=in {}ms;size_kb=size {}" -> [("latency_ms", b"in ", b"ms"), ("size_kb", b"size ", b"")]
+    """
+    patterns = []
+    for item in spec.split(";"):
+        if not item.strip():
+            continue
+        name, sep, pattern = item.partition("=")
+        prefix, hole, suffix = pattern.partition("{}")
+        if not sep or not hole or not prefix or "{}" in suffix:
+            raise ValueError(f"invalid field pattern {item!r}: expected name=prefix{{}}suffix")
+        patterns.append((name.strip(), prefix.encode("utf-8"), suffix.encode("utf-8")))
+    return patterns
+
+def _parse_digits(data, pos, limit):
+    """
+    Parse the digits at data[pos:limit] for every match at once.
+    Returns (values float64, n_digits int64).
+    """
+    value = np.zeros(len(pos), dtype=np.float64)
+    n_digits = np.zeros(len(pos), dtype=np.int64)
+    active = np.arange(len(pos))
+    for _ in range(_MAX_DIGITS):
+        active = active[pos[active] + n_digits[active] < limit[active]]
+        d = data[pos[active] + n_digits[active]].astype(np.int64) - ord("0")
+        digit = (d >= 0) & (d <= 9)
+        active, d = active[digit], d[digit]
+        if not len(active):
+            break
+        value[active] = value[active] * 10 + d
+        n_digits[active] += 1
+    return value, n_digits
+
+def extract_field(batch, prefix, suffix=b""):
+    """
+    float64 per-line values of the number between `prefix` and `suffix` (bytes)
+    in each line of `batch`; NaN where the pattern does not match.
+    """
+    out = np.full(len(batch), np.nan)
+    data, offsets = batch.data, batch.offsets
+    pos = windowing.find_all(data, prefix)
+    if not len(pos):
+        return out
+    line = np.searchsorted(offsets, pos, side="right") - 1
+    line_end = offsets[line + 1]
+    start = pos + len(prefix)
+    value, n_int = _parse_digits(data, start, line_end)
+    ok = n_int > 0
+    # optional fraction: "." followed by at least one digit
+    dot = start + n_int
+    frac_at = np.flatnonzero(ok & (dot + 1 < line_end))
+    frac_at = frac_at[data[dot[frac_at]] == ord(".")]
+    frac, n_frac = _parse_digits(data, dot[frac_at] + 1, line_end[frac_at])
+    has_frac = n_frac > 0
+    frac_at, frac, n_frac = frac_at[has_frac], frac[has_frac], n_frac[has_frac]
+    value[frac_at] += frac / 10.0 ** n_frac
+    end = dot.copy()
+    end[frac_at] += 1 + n_frac
+    # the suffix must follow inside the same line
+    ok &= end + len(suffix) <= line_end
+    for k, ch in enumerate(suffix):
+        idx = np.flatnonzero(ok)
+        ok[idx] = data[end[idx] + k] == ch
+    line, value = line[ok], value[ok]
+    # matches come in buffer order, so the first one of each line comes first
+    first = np.flatnonzero(np.r_[True, line[1:] != line[:-1]]) if len(line) else line
+    out[line[first]] = value[first]
+    return out
+
+def extract_fields(batch, patterns=None):
+    """
+    Extract every configured field into batch.columns["field_<name>"];
+    returns the field names.
+    """
+    patterns = parse_patterns(FIELD_PATTERNS) if patterns is None else patterns
+    for name, prefix, suffix in patterns:
+        if "field_" + name not in batch.columns:
+            batch.columns["field_" + name] = extract_field(batch, prefix, suffix)
+    return [name for name, _, _ in patterns]
+
+def feature_names(names):
+    """
+    Column names of field_window_features for fields `names`.
+    """
+    return [f"{name}_{label}" for name in names for label, _ in FIELD_QUANTILES]
+
+def field_window_features(batch, starts, ends, patterns=None):
+    """
+    (n_windows, n_fields * len(FIELD_QUANTILES)) matrix of per-window
+    p50/p99/max of every field (0 for windows where the field never occurs).
+    """
+    names = extract_fields(batch, patterns)
+    qs = [q for _, q in FIELD_QUANTILES]
+    cols = [windowing.window_quantiles(batch.columns["field_" + name], starts, ends, qs) for name in names]
+    if not cols:
+        return np.empty((len(starts), 0))
+    return np.nan_to_num(np.hstack(cols), nan=0.0)
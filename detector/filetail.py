@@ -0,0 +1,201 @@
+"""
+Direct ingestion of the app's rotating log file, bypassing promtail and Loki.
+
+app/generator.py writes /var/log/app/app.log through a RotatingFileHandler
+(app.log -> app.log.1 -> ... -> app.log.3). The reader remembers the inode,
+first bytes and byte offset of the file it stopped in; on the next call it
+finishes that file (wherever rotation moved it), reads any backups rotated
+after it, then the live file. The first bytes tell the file that was read
+from a later one that reused its inode, and find it again after a copy. Only complete newline-terminated lines are consumed, and large
+appended regions are read through mmap.
+
+Environment variables:
+ - LOG_FILE_PATH (default /var/log/app/app.log)
+ - LOG_FILE_BACKUPS (rotated files to search, default 3)
+ - FILE_OFFSET_PATH (persisted inode/offset, default /tmp/detector_file_offset.json)
+ - MMAP_THRESHOLD_BYTES (regions at least this large are mmapped, default 1048576)
+"""
+
+import os
+import json
+import mmap
+import time
+import numpy as np
+from logbatch import LogBatch
+import logformat
+
+LOG_FILE_PATH = os.environ.get("LOG_FILE_PATH", "/var/log/app/app.log")
+LOG_FILE_BACKUPS = int(os.environ.get("LOG_FILE_BACKUPS", "3"))
+FILE_OFFSET_PATH = os.environ.get("FILE_OFFSET_PATH", "/tmp/detector_file_offset.json")
+MMAP_THRESHOLD_BYTES = int(os.environ.get("MMAP_THRESHOLD_BYTES", str(1024 * 1024)))
+
+def load_offset(path=None):
+    """
+    Return the persisted {"inode", "offset", "head"} state, or None.
+    """
+    path = FILE_OFFSET_PATH if path is None else path
+    try:
+        with open(path) as f:
+            state = json.load(f)
+        return {"inode": int(state["inode"]), "offset": int(state["offset"]), "head": str(state.get("head", ""))}
+    except (OSError, ValueError, KeyError):
+        return None
+
+def save_offset(state, path=None):
+    path = FILE_OFFSET_PATH if path is None else path
+    if not path or state is None:
+        return
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print("Failed to write file offset:", e)
+
+_HEAD_BYTES = 64
+
+def _head(f):
+    """
+    Hex of the first bytes of an open file, which identify it across inode reuse.
+    """
+    f.seek(0)
+    return f.read(_HEAD_BYTES).hex()
+
+def _same_file(path, head):
+    try:
+        with open(path, "rb") as f:
+            return _head(f).startswith(head)
+    except OSError:
+        return False
+
+def _find_last_read(chain, state):
+    """
+    Index in `chain` of the file `state` stopped in, or None. That is the file
+    with its inode and first bytes; failing that (the inode was reused, or
+    the file was copied away and truncated, as logrotate's copytruncate does)
+    the newest file starting with its first bytes.
+    """
+    head = state.get("head", "")
+    for i, (path, inode) in enumerate(chain):
+        if inode == state["inode"] and _same_file(path, head):
+            return i
+    if head:
+        for i in range(len(chain) - 1, -1, -1):
+            if _same_file(chain[i][0], head):
+                return i
+    return None
+
+def _read_region(path, offset):
+    """
+    Read complete lines of `path` from `offset`.
+    Returns (bytes, inode, offset just past the last newline, head).
+    """
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        head = _head(f)
+        if st.st_size < offset:
+            offset = 0  # truncated / recreated in place
+        size = st.st_size - offset
+        if size <= 0:
+            return b"", st.st_ino, offset, head
+        if size >= MMAP_THRESHOLD_BYTES:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = mm.rfind(b"\n", offset, st.st_size) + 1
+                chunk = mm[offset:end] if end > offset else b""
+        else:
+            f.seek(offset)
+            raw = f.read(size)
+            end = offset + raw.rfind(b"\n") + 1
+            chunk = raw[:end - offset] if end > offset else b""
+        return chunk, st.st_ino, offset + len(chunk), head
+
+def _rotation_chain(base, backups):
+    """
+    Existing files oldest first: base.N, ..., base.1, base.
+    """
+    paths = [f"{base}.{i}" for i in range(backups, 0, -1)] + [base]
+    chain = []
+    for p in paths:
+        try:
+            chain.append((p, os.stat(p).st_ino))
+        except OSError:
+            pass
+    return chain
+
+def read_new_lines(state, base=None, backups=None):
+    """
+    Read every complete line appended since `state` across rotations.
+    Returns (raw bytes, new state).
+    """
+    base = base or LOG_FILE_PATH
+    backups = LOG_FILE_BACKUPS if backups is None else backups
+    chain = _rotation_chain(base, backups)
+    if not chain:
+        return b"", state
+    if state is None:
+        # first run: only the live file
+        todo = [(chain[-1][0], 0)]
+    else:
+        i = _find_last_read(chain, state)
+        if i is not None:
+            todo = [(chain[i][0], state["offset"])] + [(p, 0) for p, _ in chain[i + 1:]]
+        else:
+            print("Last read log file was rotated away; reading all available backups.")
+            todo = [(p, 0) for p, _ in chain]
+    chunks = []
+    new_state = state
+    for path, offset in todo:
+        try:
+            chunk, inode, end, head = _read_region(path, offset)
+        except OSError as e:
+            print(f"Failed to read {path}:", e)
+            continue
+        chunks.append(chunk)
+        new_state = {"inode": inode, "offset": end, "head": head}
+    return b"".join(chunks), new_state
+
+def lines_to_batch(raw):
+    """
+    Split newline-terminated bytes into a LogBatch without per-line Python work.
+    Timestamps come from each line's asctime; lines without one (e.g. traceback
+    continuation lines) inherit the previous line's timestamp; if nothing parses,
+    every line is stamped with the read time. Level codes and message offsets
+    parsed alongside are kept as the "level" and "msg_offset" columns.
+    """
+    buf = np.frombuffer(raw, dtype=np.uint8)
+    if not len(buf):
+        return LogBatch.empty()
+    nl = np.flatnonzero(buf == 10)
+    starts = np.concatenate([[0], nl[:-1] + 1])
+    ends = nl.copy()
+    cr = (ends > starts) & (buf[np.maximum(ends - 1, 0)] == 13)
+    ends[cr] -= 1
+    ts, valid, level, msg_offset = logformat.parse_lines(buf, starts, ends)
+    if valid.any():
+        # forward-fill timestamps; leading unparsable lines take the first valid one
+        last_valid = np.maximum.accumulate(np.where(valid, np.arange(len(ts)), -1))
+        last_valid[last_valid < 0] = np.argmax(valid)
+        ts = ts[last_valid]
+    else:
+        ts = np.full(len(starts), time.time_ns(), dtype=np.int64)
+    keep = np.ones(len(buf), dtype=bool)
+    keep[nl] = False
+    keep[ends[cr]] = False
+    data = buf[keep]
+    lens = ends - starts
+    offsets = np.zeros(len(starts) + 1, dtype=np.int64)
+    np.cumsum(lens, out=offsets[1:])
+    return LogBatch(ts, data, offsets, columns={"level": level, "msg_offset": msg_offset})
+
+def read_new_batch(state, min_ts_ns=None):
+    """
+    Read new lines since `state` as a LogBatch sorted by timestamp, dropping
+    lines older than `min_ts_ns`. Returns (batch, new_state).
+    """
+    raw, new_state = read_new_lines(state)
+    batch = lines_to_batch(raw).sort()
+    if min_ts_ns is not None and len(batch):
+        lo = int(np.searchsorted(batch.ts, min_ts_ns, side="left"))
+        batch = batch.slice(lo)
+    return batch, new_state
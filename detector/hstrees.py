@@ -0,0 +1,179 @@
+"""
+Streaming anomaly detection with Half-Space Trees (Tan, Ting & Liu, 2011).
+
+Each tree is a full binary tree of fixed depth whose nodes halve a randomly
+chosen feature's work range; trees are built once, from the feature ranges of
+the first data seen, without looking at the data distribution. Every node
+keeps two mass counters: the reference mass r of the last completed window of
+window_size instances and the latest mass l of the window being filled. An
+instance is scored against r by walking each tree down to the first node
+whose reference mass drops below size_limit (or a leaf) and summing
+r * 2**depth of that node — low mass means anomalous. Instances then add to l
+along their path; when window_size instances have arrived, l becomes the new
+r and l is cleared. Scoring and updating cost O(n_trees * depth) per window
+and memory is bounded by n_trees * 2**(depth + 1) counters, independent of the
+stream length.
+
+HalfSpaceTrees follows the IsolationForest API used by the detector (fit,
+score_samples — higher is more normal — predict -> -1/1, offset_) and adds
+partial_fit_predict for streams. Rows are processed in bulk with NumPy, one
+tree level at a time.
+
+Environment variables:
+ - HST_TREES (default 25)
+ - HST_DEPTH (default 10)
+ - HST_WINDOW_SIZE (instances per mass window, default 250)
+"""
+
+import os
+import numpy as np
+
+HST_TREES = int(os.environ.get("HST_TREES", "25"))
+HST_DEPTH = int(os.environ.get("HST_DEPTH", "10"))
+HST_WINDOW_SIZE = int(os.environ.get("HST_WINDOW_SIZE", "250"))
+
+_CHUNK_ROWS = 4096  # rows traversed at once; bounds the (rows, trees, depth) path arrays
+
+class HalfSpaceTrees:
+    def __init__(self, n_trees=None, depth=None, window_size=None, contamination=0.05, random_state=42):
+        self.n_trees = n_trees or HST_TREES
+        self.depth = depth or HST_DEPTH
+        self.window_size = window_size or HST_WINDOW_SIZE
+        self.contamination = contamination
+        self.random_state = random_state
+        self.split_dim = None    # (n_trees, n_internal) int
+        self.split_val = None    # (n_trees, n_internal) float
+        self.r = None            # (n_trees, n_nodes) reference mass
+        self.l = None            # (n_trees, n_nodes) latest mass
+        self.ref_size = 0        # instances behind r
+        self.offset_ = None
+        self._window = []        # rows of the window being filled (bounded by window_size)
+        self._filled = 0
+
+    def _build(self, X):
+        """
+        Random split dimensions and values from the work ranges around X's feature ranges.
+        """
+        rng = np.random.default_rng(self.random_state)
+        lo, hi = X.min(axis=0), X.max(axis=0)
+        hi = np.where(hi > lo, hi, lo + 1.0)
+        n_internal = 2 ** self.depth - 1
+        # per tree and dimension: a random point sq in [lo, hi] with half-width
+        # 2 * max(sq - lo, hi - sq), so every tree covers the range with margin
+        sq = rng.uniform(lo, hi, size=(self.n_trees, len(lo)))
+        half = 2 * np.maximum(sq - lo, hi - sq)
+        node_lo = (sq - half)[:, None, :]
+        node_hi = (sq + half)[:, None, :]
+        self.split_dim = np.empty((self.n_trees, n_internal), dtype=np.int64)
+        self.split_val = np.empty((self.n_trees, n_internal))
+        trees = np.arange(self.n_trees)[:, None]
+        for level in range(self.depth):
+            first = 2 ** level - 1
+            width = 2 ** level
+            dims = rng.integers(0, len(lo), size=(self.n_trees, width))
+            cols = np.arange(width)[None, :]
+            mid = (node_lo[trees, cols, dims] + node_hi[trees, cols, dims]) / 2
+            self.split_dim[:, first:first + width] = dims
+            self.split_val[:, first:first + width] = mid
+            if level + 1 < self.depth:
+                # children: left keeps [lo, mid) on dim, right [mid, hi)
+                child_lo = np.repeat(node_lo, 2, axis=1)
+                child_hi = np.repeat(node_hi, 2, axis=1)
+                child_hi[trees, 2 * cols, dims] = mid
+                child_lo[trees, 2 * cols + 1, dims] = mid
+                node_lo, node_hi = child_lo, child_hi
+        n_nodes = 2 ** (self.depth + 1) - 1
+        self.r = np.zeros((self.n_trees, n_nodes), dtype=np.int64)
+        self.l = np.zeros((self.n_trees, n_nodes), dtype=np.int64)
+
+    def _paths(self, X):
+        """
+        (n, n_trees, depth + 1) node indices visited by every row in every tree.
+        """
+        n = X.shape[0]
+        trees = np.arange(self.n_trees)[None, :]
+        paths = np.zeros((n, self.n_trees, self.depth + 1), dtype=np.int64)
+        node = np.zeros((n, self.n_trees), dtype=np.int64)
+        rows = np.arange(n)[:, None]
+        for level in range(self.depth):
+            dim = self.split_dim[trees, node]
+            right = X[rows, dim] >= self.split_val[trees, node]
+            node = 2 * node + 1 + right
+            paths[:, :, level + 1] = node
+        return paths
+
+    def _add_mass(self, paths):
+        trees = np.broadcast_to(np.arange(self.n_trees)[None, :, None], paths.shape)
+        self.l += np.bincount(
+            (trees * self.l.shape[1] + paths).ravel(), minlength=self.l.size
+        ).reshape(self.l.shape)
+
+    def _swap(self):
+        self.r, self.l = self.l, np.zeros_like(self.l)
+        self.ref_size = self._filled
+        window = np.vstack(self._window)
+        self._window, self._filled = [], 0
+        self.offset_ = np.percentile(self.score_samples(window), 100.0 * self.contamination)
+
+    def score_samples(self, X):
+        """
+        Mass score of every row against the reference window; higher is more normal.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if self.split_dim is None or self.ref_size == 0:
+            return np.zeros(X.shape[0])
+        if X.shape[0] > _CHUNK_ROWS:
+            return np.concatenate([self.score_samples(X[i:i + _CHUNK_ROWS]) for i in range(0, X.shape[0], _CHUNK_ROWS)])
+        paths = self._paths(X)
+        mass = self.r[np.arange(self.n_trees)[None, :, None], paths]
+        # stop at the first node whose reference mass is below the size limit
+        size_limit = 0.1 * self.ref_size
+        below = mass < size_limit
+        stop = np.where(below.any(axis=2), below.argmax(axis=2), self.depth)
+        stop_mass = np.take_along_axis(mass, stop[:, :, None], axis=2)[:, :, 0]
+        return (stop_mass * np.exp2(stop)).sum(axis=1) / (self.n_trees * self.ref_size)
+
+    def predict(self, X):
+        """
+        -1 for anomalies, 1 otherwise (all 1 until a reference window exists).
+        """
+        scores = self.score_samples(X)
+        if self.offset_ is None:
+            return np.ones(len(scores), dtype=np.int64)
+        return np.where(scores < self.offset_, -1, 1)
+
+    def fit(self, X):
+        """
+        Build the trees and take X as the reference mass profile.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        self._build(X)
+        self._window, self._filled = [X], len(X)
+        for i in range(0, X.shape[0], _CHUNK_ROWS):
+            self._add_mass(self._paths(X[i:i + _CHUNK_ROWS]))
+        self._swap()
+        return self
+
+    def partial_fit_predict(self, X):
+        """
+        Score each row against the current reference, then add it to the
+        latest window, swapping the windows every window_size rows. Returns
+        -1/1 predictions in row order.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if not len(X):
+            return np.ones(0, dtype=np.int64)
+        if self.split_dim is None:
+            self._build(X)
+        preds = np.empty(X.shape[0], dtype=np.int64)
+        i = 0
+        while i < X.shape[0]:
+            chunk = X[i:i + min(self.window_size - self._filled, _CHUNK_ROWS)]
+            preds[i:i + len(chunk)] = self.predict(chunk)
+            self._add_mass(self._paths(chunk))
+            self._window.append(chunk)
+            self._filled += len(chunk)
+            if self._filled >= self.window_size:
+                self._swap()
+            i += len(chunk)
+        return preds
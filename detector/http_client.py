@@ -0,0 +1,102 @@
+"""
+Shared pooled HTTP client for every outbound detector call (Loki, Slack, GitHub).
+
+ - One requests.Session, so TCP/TLS connections are kept alive and reused
+ - Per-host connection pool bounded by HTTP_POOL_MAXSIZE
+ - Accept-Encoding: gzip on every request
+ - Exponential-backoff retries on connect errors, and on 429/5xx for idempotent methods
+ - Per-endpoint latency timers (see latency_stats / print_latency_stats)
+
+Environment variables:
+ - HTTP_POOL_MAXSIZE (connections kept per host, default 8)
+ - HTTP_RETRIES (max retries per request, default 3)
+ - HTTP_BACKOFF (backoff factor in seconds, default 0.5)
+"""
+
+import os
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "8"))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", "0.5"))
+
+_session = None
+_session_lock = threading.Lock()
+_timings = {}  # endpoint -> [calls, total_seconds, max_seconds]
+_timings_lock = threading.Lock()
+
+def _build_session():
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        # POSTs (Slack, GitHub issues) are only retried when the connection failed
+        # before the request was sent, so an alert or issue is never duplicated.
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_MAXSIZE,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        pool_block=True,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip"})
+    return session
+
+def get_session():
+    """
+    Return the process-wide pooled session, creating it on first use.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+def _record(endpoint, elapsed):
+    with _timings_lock:
+        stats = _timings.setdefault(endpoint, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+def request(method, url, endpoint=None, **kwargs):
+    """
+    Send a request on the pooled session and time it under `endpoint`
+    (defaults to the URL without its query string).
+    """
+    endpoint = endpoint or url.split("?", 1)[0]
+    t0 = time.perf_counter()
+    try:
+        return get_session().request(method, url, **kwargs)
+    finally:
+        _record(endpoint, time.perf_counter() - t0)
+
+def get(url, endpoint=None, **kwargs):
+    return request("GET", url, endpoint=endpoint, **kwargs)
+
+def post(url, endpoint=None, **kwargs):
+    return request("POST", url, endpoint=endpoint, **kwargs)
+
+def latency_stats():
+    """
+    Return {endpoint: {"calls", "total_s", "avg_s", "max_s"}} for all timed calls.
+    """
+    with _timings_lock:
+        return {
+            name: {"calls": c, "total_s": total, "avg_s": total / c if c else 0.0, "max_s": mx}
+            for name, (c, total, mx) in _timings.items()
+        }
+
+def print_latency_stats():
+    for name, st in sorted(latency_stats().items()):
+        print(f"HTTP {name}: calls={st['calls']} avg={st['avg_s'] * 1000:.1f}ms max={st['max_s'] * 1000:.1f}ms")
@@ -0,0 +1,149 @@
+"""
+Columnar container for a batch of log lines.
+
+A LogBatch keeps
+ - ts:      int64 array of nanosecond timestamps
+ - data:    one contiguous uint8 buffer with every line's UTF-8 bytes
+ - offsets: int64 array of n+1 offsets; line i is data[offsets[i]:offsets[i+1]]
+ - labels:  optional {name: (codes int32 array, categories list)} columns
+ - columns: optional {name: array} of derived per-line values (e.g. template ids)
+
+so millions of lines cost a few arrays instead of millions of tuples and
+strings, and ordering is an integer argsort over `ts`.
+"""
+
+import numpy as np
+
+_ENCODING = "utf-8"
+_ERRORS = "surrogatepass"
+
+class LogBatch:
+    __slots__ = ("ts", "data", "offsets", "labels", "columns")
+
+    def __init__(self, ts, data, offsets, labels=None, columns=None):
+        self.ts = np.asarray(ts, dtype=np.int64)
+        self.data = np.asarray(data, dtype=np.uint8)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.labels = labels or {}
+        self.columns = columns or {}
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, np.int64), np.empty(0, np.uint8), np.zeros(1, np.int64))
+
+    @classmethod
+    def from_entries(cls, entries, labels=None):
+        """
+        Build a batch from (ts_ns, line) pairs. `labels` optionally maps a label
+        name to a per-line sequence of values, stored as categorical codes.
+        """
+        entries = list(entries)
+        if not entries:
+            return cls.empty()
+        encoded = [line.encode(_ENCODING, _ERRORS) for _, line in entries]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        ts = np.fromiter((ts for ts, _ in entries), dtype=np.int64, count=len(entries))
+        cols = {}
+        for name, values in (labels or {}).items():
+            categories, codes = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+            cols[name] = (codes.astype(np.int32), list(categories))
+        return cls(ts, data, offsets, cols)
+
+    @classmethod
+    def concat(cls, batches):
+        """
+        Concatenate batches in order (no re-sorting).
+        """
+        batches = [b for b in batches if len(b)]
+        if not batches:
+            return cls.empty()
+        if len(batches) == 1:
+            return batches[0]
+        ts = np.concatenate([b.ts for b in batches])
+        data = np.concatenate([b.data for b in batches])
+        shifts = np.cumsum([0] + [len(b.data) for b in batches[:-1]])
+        offsets = np.concatenate([batches[0].offsets[:1]] + [b.offsets[1:] - b.offsets[0] + s for b, s in zip(batches, shifts)])
+        labels = {}
+        names = set(batches[0].labels)
+        for b in batches[1:]:
+            names &= set(b.labels)
+        for name in names:
+            categories = sorted(set().union(*(b.labels[name][1] for b in batches)))
+            index = {c: i for i, c in enumerate(categories)}
+            codes = np.concatenate([
+                np.asarray([index[c] for c in b.labels[name][1]], dtype=np.int32)[b.labels[name][0]]
+                for b in batches
+            ])
+            labels[name] = (codes, categories)
+        names = set(batches[0].columns)
+        for b in batches[1:]:
+            names &= set(b.columns)
+        columns = {name: np.concatenate([b.columns[name] for b in batches]) for name in names}
+        return cls(ts, data, offsets - offsets[0], labels, columns)
+
+    def __len__(self):
+        return len(self.ts)
+
+    @property
+    def nbytes(self):
+        return (
+            self.ts.nbytes + self.data.nbytes + self.offsets.nbytes
+            + sum(c.nbytes for c, _ in self.labels.values())
+            + sum(c.nbytes for c in self.columns.values())
+        )
+
+    def byte_lengths(self):
+        return np.diff(self.offsets)
+
+    def line(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode(_ENCODING, _ERRORS)
+
+    def lines(self):
+        """
+        Decode every line to str (materialises per-line objects; avoid on hot paths).
+        """
+        raw = self.data.tobytes()
+        offs = self.offsets.tolist()
+        return [raw[offs[i]:offs[i + 1]].decode(_ENCODING, _ERRORS) for i in range(len(self))]
+
+    def entries(self):
+        return list(zip(self.ts.tolist(), self.lines()))
+
+    def take(self, idx):
+        """
+        Return a new batch holding rows `idx` in that order; the byte buffer is
+        gathered with one vectorized index instead of per-line copies.
+        """
+        idx = np.asarray(idx, dtype=np.int64)
+        starts = self.offsets[:-1][idx]
+        lens = self.offsets[1:][idx] - starts
+        offsets = np.zeros(len(idx) + 1, dtype=np.int64)
+        np.cumsum(lens, out=offsets[1:])
+        gather = np.repeat(starts - offsets[:-1], lens) + np.arange(offsets[-1], dtype=np.int64)
+        labels = {name: (codes[idx], cats) for name, (codes, cats) in self.labels.items()}
+        columns = {name: col[idx] for name, col in self.columns.items()}
+        return LogBatch(self.ts[idx], self.data[gather], offsets, labels, columns)
+
+    def slice(self, start, stop=None):
+        """
+        Contiguous rows [start:stop] as a batch sharing this batch's buffers.
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        stop = max(start, stop)
+        offsets = self.offsets[start:stop + 1]
+        labels = {name: (codes[start:stop], cats) for name, (codes, cats) in self.labels.items()}
+        columns = {name: col[start:stop] for name, col in self.columns.items()}
+        return LogBatch(self.ts[start:stop], self.data[offsets[0]:offsets[-1]], offsets - offsets[0], labels, columns)
+
+    def is_sorted(self):
+        return len(self) < 2 or bool(np.all(self.ts[1:] >= self.ts[:-1]))
+
+    def sort(self):
+        """
+        Return the batch ordered by timestamp (stable integer argsort).
+        """
+        if self.is_sorted():
+            return self
+        return self.take(np.argsort(self.ts, kind="stable"))
@@ -0,0 +1,127 @@
+"""
+Byte-level parsing of the app's log format, "%(asctime)s %(levelname)s %(message)s",
+e.g. "2024-05-01 12:00:00,123 ERROR Disk quota exceeded for user id=4".
+
+Fields are read straight from a LogBatch's UTF-8 buffer with NumPy indexing,
+without decoding lines to str. asctime is taken to be UTC (the app container's
+default timezone). The level sits at a fixed position after asctime and is
+exposed as a uint8 code per line (LEVEL_UNPARSED for lines in another format),
+together with the offset of the message inside the line.
+"""
+
+import numpy as np
+
+ASCTIME_LEN = 23  # "YYYY-MM-DD HH:MM:SS,mmm"
+
+LEVEL_UNPARSED, LEVEL_DEBUG, LEVEL_INFO, LEVEL_WARNING, LEVEL_ERROR, LEVEL_CRITICAL = range(6)
+LEVEL_CODES = {
+    b"DEBUG": LEVEL_DEBUG,
+    b"INFO": LEVEL_INFO,
+    b"WARNING": LEVEL_WARNING,
+    b"WARN": LEVEL_WARNING,
+    b"ERROR": LEVEL_ERROR,
+    b"CRITICAL": LEVEL_CRITICAL,
+}
+
+_DIGIT_POS = np.array([0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18, 20, 21, 22])
+_SEPARATORS = {4: ord("-"), 7: ord("-"), 10: ord(" "), 13: ord(":"), 16: ord(":"), 19: ord(",")}
+
+def _field(digits, lo, hi):
+    out = np.zeros(len(digits), dtype=np.int64)
+    for i in range(lo, hi):
+        out = out * 10 + digits[:, i]
+    return out
+
+def parse_asctime_ns(data, starts, ends):
+    """
+    Parse the leading asctime of each line [starts[i], ends[i]) of `data` (uint8).
+    Returns (ts_ns int64 array, valid bool array); invalid rows hold 0.
+    """
+    n = len(starts)
+    valid = (ends - starts) >= ASCTIME_LEN
+    if n == 0:
+        return np.zeros(0, np.int64), valid
+    idx = np.where(valid, starts, 0)[:, None] + np.arange(ASCTIME_LEN)
+    head = data[np.minimum(idx, max(len(data) - 1, 0))] if len(data) else np.zeros((n, ASCTIME_LEN), np.uint8)
+    for pos, ch in _SEPARATORS.items():
+        valid &= head[:, pos] == ch
+    digits = head[:, _DIGIT_POS].astype(np.int64) - ord("0")
+    valid &= np.all((digits >= 0) & (digits <= 9), axis=1)
+    digits = np.where(valid[:, None], digits, 0)
+    year, month, day = _field(digits, 0, 4), _field(digits, 4, 6), _field(digits, 6, 8)
+    hour, minute, sec, ms = _field(digits, 8, 10), _field(digits, 10, 12), _field(digits, 12, 14), _field(digits, 14, 17)
+    valid &= (year >= 1970) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    year = np.where(valid, year, 1970)
+    month = np.where(valid, month, 1)
+    day = np.where(valid, day, 1)
+    dates = (year - 1970).astype("datetime64[Y]") + (month - 1).astype("timedelta64[M]")
+    days = dates.astype("datetime64[D]").astype(np.int64) + (day - 1)
+    ts = ((days * 24 + hour) * 60 + minute) * 60 + sec
+    ts = ts * 1_000_000_000 + ms * 1_000_000
+    return np.where(valid, ts, 0), valid
+
+def _asctime_rows(data, starts, ends):
+    """
+    Indices of the lines whose first bytes have the asctime shape (separators
+    in place), narrowed one byte position at a time.
+    """
+    rows = np.flatnonzero((ends - starts) >= ASCTIME_LEN)
+    for pos, ch in _SEPARATORS.items():
+        rows = rows[data[starts[rows] + pos] == ch]
+    return rows
+
+def parse_level(data, starts, ends, rows):
+    """
+    Read the levelname following the asctime of lines `rows` (indices of lines
+    with a valid asctime). Returns (level uint8 array, msg_offset int32 array):
+    the level code and the message's byte offset from the line start (0 where
+    unparsed).
+    """
+    n = len(starts)
+    level = np.zeros(n, dtype=np.uint8)
+    msg_offset = np.zeros(n, dtype=np.int32)
+    pos = starts[rows] + ASCTIME_LEN + 1  # first byte of the levelname
+    end = ends[rows]
+    ok = (pos <= end) & (data[np.minimum(pos, end) - 1] == ord(" "))
+    rows, pos, end = rows[ok], pos[ok], end[ok]
+    # the first four bytes tell every name apart, so match them as one uint32
+    # and check the remaining bytes on the few candidates only
+    last = max(len(data) - 1, 0)
+    word = np.zeros(len(rows), dtype=np.uint32)
+    for k in range(4):
+        word |= data[np.minimum(pos + k, last)].astype(np.uint32) << np.uint32(8 * k)
+    for name, code in LEVEL_CODES.items():
+        m = len(name)
+        sel = np.flatnonzero(word == np.frombuffer(name[:4], dtype="<u4")[0])
+        p, e = pos[sel], end[sel]
+        # the name must be followed by a space or the end of the line ("WARN" vs "WARNING")
+        hit = p + m <= e
+        for k in range(4, m + 1):
+            byte = data[np.minimum(p + k, last)]
+            hit &= byte == name[k] if k < m else (p + m == e) | (byte == ord(" "))
+        sel, p, e = sel[hit], p[hit], e[hit]
+        level[rows[sel]] = code
+        msg_offset[rows[sel]] = np.minimum(p + m + 1, e) - starts[rows[sel]]
+    return level, msg_offset
+
+def parse_lines(data, starts, ends):
+    """
+    Parse timestamp, level and message offset of every line in one pass.
+    Returns (ts_ns, valid, level, msg_offset); see parse_asctime_ns and parse_level.
+    """
+    ts, valid = parse_asctime_ns(data, starts, ends)
+    level, msg_offset = parse_level(data, starts, ends, np.flatnonzero(valid))
+    return ts, valid, level, msg_offset
+
+def level_codes(batch):
+    """
+    Per-line level codes of a LogBatch, parsed once and kept in
+    batch.columns["level"] (with the message offsets in "msg_offset").
+    """
+    if "level" not in batch.columns:
+        starts, ends = batch.offsets[:-1], batch.offsets[1:]
+        rows = _asctime_rows(batch.data, starts, ends)
+        level, msg_offset = parse_level(batch.data, starts, ends, rows)
+        batch.columns["level"] = level
+        batch.columns["msg_offset"] = msg_offset
+    return batch.columns["level"]
@@ -0,0 +1,105 @@
+"""
+Server-side feature source built from LogQL metric queries.
+
+Instead of downloading raw lines, Loki aggregates each METRIC_STEP_SECONDS
+bucket itself and only the resulting time series come back. Every step becomes
+one window with the same four columns as the line-window features in detector.py:
+ - avg_length: bytes_over_time / count_over_time
+ - error_count: lines whose parsed level is ERROR
+ - warn_count: lines whose parsed level is WARN/WARNING
+ - unique_messages: number of distinct message bodies
+
+The level and message are cut out of the app's
+"%(asctime)s %(levelname)s %(message)s" lines by a `pattern` parser stage.
+Loki rejects range queries of more than 11,000 points per series, so longer
+ranges (e.g. a 7-day training baseline) are queried in chunks of
+MAX_POINTS_PER_QUERY steps.
+
+Environment variables:
+ - METRIC_STEP_SECONDS (bucket width / query step in seconds, default 30)
+"""
+
+import os
+import time
+import numpy as np
+import http_client
+
+METRIC_STEP_SECONDS = int(os.environ.get("METRIC_STEP_SECONDS", "30"))
+
+MAX_POINTS_PER_QUERY = 10_000
+
+# "<date> <time> <level> <message>" as written by app/generator.py
+_PATTERN = '| pattern "<_> <_> <level> <msg>"'
+
+def metric_queries(selector, step_s):
+    rng = f"[{step_s}s]"
+    return {
+        "count": f"sum(count_over_time({selector}{rng}))",
+        "bytes": f"sum(bytes_over_time({selector}{rng}))",
+        "levels": f"sum by (level) (count_over_time({selector} {_PATTERN}{rng}))",
+        "unique": f"count(sum by (msg) (count_over_time({selector} {_PATTERN}{rng})))",
+    }
+
+def query_metric_range(loki_url, query, start_s, end_s, step_s):
+    """
+    Run a LogQL metric query over query_range. Returns the list of
+    {"metric": {...}, "values": [[ts_s, "value"], ...]} series.
+    """
+    params = {"query": query, "start": start_s, "end": end_s, "step": step_s}
+    r = http_client.get(f"{loki_url}/loki/api/v1/query_range", endpoint="loki.query_range.metric", params=params, timeout=30)
+    r.raise_for_status()
+    data = r.json().get("data", {})
+    if data.get("resultType") != "matrix":
+        raise ValueError(f"expected a matrix result, got {data.get('resultType')!r}")
+    return data.get("result", [])
+
+def query_metric_chunks(loki_url, query, start_s, end_s, step_s):
+    """
+    query_metric_range over [start_s, end_s] in chunks of at most
+    MAX_POINTS_PER_QUERY steps; returns the series of every chunk.
+    """
+    series = []
+    chunk_s = step_s * MAX_POINTS_PER_QUERY
+    for lo in range(start_s, end_s + 1, chunk_s):
+        series.extend(query_metric_range(loki_url, query, lo, min(lo + chunk_s - step_s, end_s), step_s))
+    return series
+
+def series_to_column(series, start_s, step_s, n_steps):
+    """
+    Sum the given series onto a dense float array with one slot per step.
+    """
+    col = np.zeros(n_steps)
+    for s in series:
+        if not s.get("values"):
+            continue
+        vals = np.asarray(s["values"], dtype=float)
+        idx = np.rint((vals[:, 0] - start_s) / step_s).astype(np.int64)
+        ok = (idx >= 0) & (idx < n_steps)
+        np.add.at(col, idx[ok], vals[ok, 1])
+    return col
+
+def build_metric_features(loki_url, job="app", minutes=10, step_s=None, end_s=None):
+    """
+    Build the (n_steps, 4) feature matrix for the last `minutes` from metric queries.
+    Each sample at time t covers (t - step, t]. Returns (features, step_end_times_s);
+    steps without any lines are dropped.
+    """
+    step_s = step_s or METRIC_STEP_SECONDS
+    end_s = end_s if end_s is not None else int(time.time())
+    # align to the step so repeated runs hit the same buckets
+    end_s -= end_s % step_s
+    start_s = end_s - minutes * 60
+    n_steps = (end_s - start_s) // step_s + 1
+    times = start_s + step_s * np.arange(n_steps)
+    queries = metric_queries(f'{{job="{job}"}}', step_s)
+    fetch = lambda name: query_metric_chunks(loki_url, queries[name], start_s, end_s, step_s)
+    count = series_to_column(fetch("count"), start_s, step_s, n_steps)
+    nbytes = series_to_column(fetch("bytes"), start_s, step_s, n_steps)
+    levels = fetch("levels")
+    errors = series_to_column([s for s in levels if s["metric"].get("level", "").upper() == "ERROR"], start_s, step_s, n_steps)
+    warns = series_to_column([s for s in levels if s["metric"].get("level", "").upper().startswith("WARN")], start_s, step_s, n_steps)
+    unique = series_to_column(fetch("unique"), start_s, step_s, n_steps)
+    avg_length = np.divide(nbytes, count, out=np.zeros(n_steps), where=count > 0)
+    features = np.column_stack([avg_length, errors, warns, unique])
+    keep = count > 0
+    return features[keep], times[keep]
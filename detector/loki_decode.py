@@ -0,0 +1,151 @@
+"""
+Incremental decoder for Loki query_range stream responses.
+
+Walks `data.result[].values[]` straight from the response body chunks and yields
+(ts_ns, line) pairs as soon as each pair is complete, without ever building the
+full JSON document in memory. Everything outside the value pairs (stream labels,
+stats) is tokenised and skipped.
+"""
+
+import re
+import codecs
+from json.decoder import scanstring, JSONDecodeError
+
+_WS = re.compile(r"[ \t\n\r]*")
+_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?")
+_LITERALS = {"t": "true", "f": "false", "n": "null"}
+_PAIR = re.compile(r'\[[ \t\n\r]*"(\d+)"[ \t\n\r]*,[ \t\n\r]*"([^"\\]*(?:\\.[^"\\]*)*)"[ \t\n\r]*\][ \t\n\r]*,?[ \t\n\r]*')
+
+# stack frame slots
+_KIND, _KEY, _EXPECT_KEY, _IS_PAIR, _IS_VALUES = range(5)
+
+def _is_values_path(stack):
+    # stack describes {"data": {"result": [ {"values": [ ...
+    return (
+        len(stack) == 5
+        and stack[0][_KEY] == "data"
+        and stack[1][_KEY] == "result"
+        and stack[2][_KIND] == "a"
+        and stack[3][_KEY] == "values"
+        and stack[4][_KIND] == "a"
+    )
+
+def _match_pairs(buf, pos, out):
+    """
+    Fast path: consume a run of complete ["<ts>", "<line>"] pairs (and the commas
+    between them) starting at `pos`, appending (ts_ns, line) to `out`.
+    Returns the position after the run; anything incomplete or unusual is left
+    for token-by-token parsing.
+    """
+    match = _PAIR.match
+    while True:
+        m = match(buf, pos)
+        if m is None:
+            return pos
+        line = m.group(2)
+        if "\\" in line:
+            line = scanstring(line + '"', 0)[0]
+        out.append((int(m.group(1)), line))
+        pos = m.end()
+
+def iter_query_range_values(chunks):
+    """
+    Yield (ts_ns:int, line:str) for every entry of a query_range streams response,
+    reading the body incrementally from an iterable of byte chunks
+    (e.g. requests' Response.iter_content()).
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf = ""
+    pos = 0
+    eof = False
+    stack = []
+    pair = []
+    while True:
+        need_more = False
+        n = len(buf)
+        while not need_more:
+            pos = _WS.match(buf, pos).end()
+            if pos >= n:
+                need_more = True
+                break
+            c = buf[pos]
+            top = stack[-1] if stack else None
+            if c == '"':
+                try:
+                    s, end = scanstring(buf, pos + 1)
+                except JSONDecodeError:
+                    if eof:
+                        raise
+                    need_more = True
+                    break
+                pos = end
+                if top is not None and top[_EXPECT_KEY]:
+                    top[_KEY] = s
+                    top[_EXPECT_KEY] = False
+                elif top is not None and top[_IS_PAIR]:
+                    pair.append(s)
+            elif c == "," or c == ":":
+                pos += 1
+                if c == "," and top is not None and top[_KIND] == "m":
+                    top[_EXPECT_KEY] = True
+            elif c == "{":
+                pos += 1
+                stack.append(["m", None, True, False, False])
+            elif c == "[":
+                if top is not None and top[_IS_VALUES]:
+                    run = []
+                    end = _match_pairs(buf, pos, run)
+                    if run:
+                        # the run ends at a pair boundary; a comma consumed after the
+                        # last pair is harmless inside an array
+                        pos = end
+                        yield from run
+                        continue
+                    pos += 1
+                    stack.append(["a", None, False, True, False])
+                    pair = []
+                else:
+                    pos += 1
+                    stack.append(["a", None, False, False, False])
+                    if _is_values_path(stack):
+                        stack[-1][_IS_VALUES] = True
+            elif c == "}" or c == "]":
+                pos += 1
+                frame = stack.pop()
+                if frame[_IS_PAIR] and len(pair) >= 2:
+                    yield int(pair[0]), pair[1]
+            elif c in _LITERALS:
+                lit = _LITERALS[c]
+                if n - pos < len(lit) and not eof:
+                    need_more = True
+                    break
+                if buf[pos:pos + len(lit)] != lit:
+                    raise ValueError(f"Invalid JSON literal at offset {pos}")
+                pos += len(lit)
+            else:
+                m = _NUMBER.match(buf, pos)
+                if m is None:
+                    if not eof and c == "-" and pos + 1 >= n:
+                        need_more = True
+                        break
+                    raise ValueError(f"Unexpected character {c!r} in Loki response")
+                if not eof and (m.end() >= n or buf[m.end()] in ".eE+-"):
+                    # the number may continue in the next chunk
+                    need_more = True
+                    break
+                pos = m.end()
+                if top is not None and top[_IS_PAIR]:
+                    pair.append(m.group())
+        if eof:
+            if stack:
+                raise ValueError("Truncated Loki response")
+            return
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            text = decoder.decode(b"", final=True)
+        else:
+            text = decoder.decode(chunk)
+        buf = buf[pos:] + text
+        pos = 0
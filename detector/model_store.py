@@ -0,0 +1,329 @@
+"""
+Persisted detector model (see train.py).
+
+train.py fits a model on a baseline period and saves it here together with
+its feature schema (the column names it was trained on, and the feature
+source and windowing they were made with) and training
+metadata. The detector then only loads and scores it, instead of fitting a
+throwaway model on the very windows it scores (where a long incident becomes
+"normal"). Artifacts are joblib pickles written atomically; they are loaded
+with mmap_mode="r", so the trees' node arrays are memory-mapped rather than
+copied, and cached until the file changes.
+
+Streaming engines (DETECTOR_ENGINE=hst or robust) keep learning between
+runs; their mutable state is saved separately at ENGINE_STATE_PATH and loaded
+without memory mapping.
+
+Trained models can also be published to a local registry so they can be
+shipped, pinned and rolled back:
+
+    MODEL_REGISTRY_DIR/
+      versions/v0001/model.joblib     the artifact, as at MODEL_PATH
+      versions/v0001/manifest.json    feature schema, training window, validation metrics
+      current                         the active version id
+
+Versions are staged in a temporary directory and renamed into place, and the
+"current" pointer is replaced atomically, so readers never see a partial
+version. A ModelWatcher polls the pointer from a background thread, loads a
+newly activated version there and then swaps a single reference; the scoring
+path only reads that reference (no lock, no I/O), and each batch is scored
+with the model it started with. Run `python model_store.py` to list versions
+and `python model_store.py activate <version>` to pin or roll back.
+
+Environment variables:
+ - MODEL_PATH (default /tmp/detector_model.joblib; empty disables, the
+   detector then fits a model on every run as before)
+ - MODEL_REGISTRY_DIR (default /tmp/detector_models; empty disables). Its
+   current version takes precedence over MODEL_PATH.
+ - MODEL_RELOAD_SECONDS (how often the current pointer is checked, default 5)
+ - ENGINE_STATE_PATH (streaming engine state, default /tmp/detector_engine.joblib; empty keeps it in memory only)
+"""
+
+import os
+import sys
+import json
+import shutil
+import threading
+import joblib
+
+MODEL_PATH = os.environ.get("MODEL_PATH", "/tmp/detector_model.joblib")
+ENGINE_STATE_PATH = os.environ.get("ENGINE_STATE_PATH", "/tmp/detector_engine.joblib")
+MODEL_REGISTRY_DIR = os.environ.get("MODEL_REGISTRY_DIR", "/tmp/detector_models")
+MODEL_RELOAD_SECONDS = float(os.environ.get("MODEL_RELOAD_SECONDS", "5"))
+
+class TrainedModel:
+    __slots__ = ("model", "names", "meta", "context")
+
+    def __init__(self, model, names, meta=None, context=None):
+        self.model = model
+        self.names = list(names)
+        self.meta = dict(meta or {})
+        self.context = dict(context or {})
+
+    def matches(self, names, context=None):
+        """
+        Was the model trained on exactly these feature columns, made the same
+        way (feature source and windowing, see detector.feature_context)?
+        """
+        return list(names or []) == self.names and dict(context or {}) == self.context
+
+    def predict(self, features):
+        return self.model.predict(features)
+
+    def score_samples(self, features):
+        return self.model.score_samples(features)
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def _dump(trained, path):
+    joblib.dump({"model": trained.model, "names": trained.names, "meta": trained.meta, "context": trained.context}, path)
+
+def _load(path):
+    artifact = joblib.load(path, mmap_mode="r")
+    return TrainedModel(artifact["model"], artifact["names"], artifact.get("meta"), artifact.get("context"))
+
+def save_model(trained, path=None):
+    path = path or MODEL_PATH
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    _dump(trained, tmp)
+    os.replace(tmp, path)
+
+def load_model(path=None):
+    """
+    Return the TrainedModel at `path`, or None when there is none (or it cannot
+    be read). Reloads only when the file's mtime or size changes.
+    """
+    path = path or MODEL_PATH
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+    try:
+        trained = _load(path)
+    except Exception as e:
+        print(f"Failed to load model {path}:", e)
+        return None
+    with _cache_lock:
+        _cache[path] = (key, trained)
+    return trained
+
+def save_engine_state(engine, names, path=None, context=None):
+    path = ENGINE_STATE_PATH if path is None else path
+    if not path:
+        return
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        joblib.dump({"engine": engine, "names": list(names), "context": dict(context or {})}, tmp)
+        os.replace(tmp, path)
+    except OSError as e:
+        print("Failed to save engine state:", e)
+
+def load_engine_state(names, path=None, context=None):
+    """
+    The saved streaming engine for feature columns `names` made under
+    `context`, or None.
+    """
+    path = ENGINE_STATE_PATH if path is None else path
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        state = joblib.load(path)
+    except Exception as e:
+        print(f"Failed to load engine state {path}:", e)
+        return None
+    if state.get("names") != list(names) or state.get("context", {}) != dict(context or {}):
+        return None
+    return state["engine"]
+
+class ModelRegistry:
+    def __init__(self, directory=None):
+        self.directory = MODEL_REGISTRY_DIR if directory is None else directory
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def _versions_dir(self):
+        return os.path.join(self.directory, "versions")
+
+    def versions(self):
+        """
+        Version ids, oldest first.
+        """
+        try:
+            return sorted(v for v in os.listdir(self._versions_dir()) if v.startswith("v"))
+        except OSError:
+            return []
+
+    def manifest(self, version):
+        with open(os.path.join(self._versions_dir(), version, "manifest.json")) as f:
+            return json.load(f)
+
+    def publish(self, trained, metrics=None, activate=True):
+        """
+        Store `trained` as a new version with its manifest (feature schema,
+        training window from its meta, validation `metrics`) and, with
+        `activate`, make it current. Returns the version id.
+        """
+        os.makedirs(self._versions_dir(), exist_ok=True)
+        staging = os.path.join(self._versions_dir(), f".staging-{os.getpid()}-{threading.get_ident()}")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        _dump(trained, os.path.join(staging, "model.joblib"))
+        manifest = {
+            "names": trained.names,
+            "context": trained.context,
+            "train_start_ns": trained.meta.get("train_start_ns"),
+            "train_end_ns": trained.meta.get("train_end_ns"),
+            "metrics": dict(metrics or {}),
+            "meta": {k: v for k, v in trained.meta.items() if k != "tree_generations"},
+        }
+        while True:
+            versions = self.versions()
+            version = f"v{int(versions[-1][1:]) + 1 if versions else 1:04d}"
+            with open(os.path.join(staging, "manifest.json"), "w") as f:
+                json.dump(dict(manifest, version=version), f, indent=2)
+            try:
+                # rename fails if a concurrent publish took the id; retry with the next one
+                os.rename(staging, os.path.join(self._versions_dir(), version))
+                break
+            except OSError:
+                if not os.path.isdir(staging):
+                    raise
+        if activate:
+            self.activate(version)
+        return version
+
+    def activate(self, version):
+        """
+        Point "current" at an existing version (publish, pin or roll back).
+        """
+        if not os.path.exists(os.path.join(self._versions_dir(), version, "model.joblib")):
+            raise ValueError(f"unknown model version {version!r}")
+        tmp = os.path.join(self.directory, f"current.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w") as f:
+            f.write(version + "\n")
+        os.replace(tmp, os.path.join(self.directory, "current"))
+
+    def current_version(self):
+        try:
+            with open(os.path.join(self.directory, "current")) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def load(self, version):
+        """
+        The TrainedModel of `version`, memory-mapped like load_model.
+        """
+        return _load(os.path.join(self._versions_dir(), version, "model.joblib"))
+
+class ModelWatcher(threading.Thread):
+    """
+    Background thread keeping `current` at the registry's current model.
+    `current` is a (version, TrainedModel) tuple, or None while no version is
+    active; it is replaced as a whole, so readers take it without locking.
+    """
+
+    def __init__(self, registry, interval=None):
+        super().__init__(daemon=True)
+        self.registry = registry
+        self.interval = MODEL_RELOAD_SECONDS if interval is None else interval
+        self.current = None
+        self.reloads = 0
+        self._failed = None
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def poll(self):
+        """
+        Load the current version if it changed. Returns True when `current` was swapped.
+        """
+        version = self.registry.current_version()
+        held = self.current[0] if self.current else None
+        if version == held or version == self._failed:
+            return False
+        if version is None:
+            self.current = None
+            return True
+        try:
+            trained = self.registry.load(version)
+        except Exception as e:
+            # keep scoring with the model we have; retry once the pointer moves again
+            self._failed = version
+            print(f"Failed to load model version {version}:", e)
+            return False
+        self._failed = None
+        self.current = (version, trained)
+        self.reloads += 1
+        if held:
+            print(f"Swapped model {held} -> {version}.")
+        return True
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.poll()
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+def current_model():
+    """
+    The model to score with: the registry's current version (kept up to date
+    by a ModelWatcher started on first use), else the model at MODEL_PATH.
+    """
+    global _watcher
+    watcher = _watcher
+    if watcher is None:
+        registry = ModelRegistry()
+        if not registry.enabled:
+            return load_model()
+        with _watcher_lock:
+            if _watcher is None:
+                watcher = ModelWatcher(registry)
+                watcher.poll()
+                watcher.start()
+                _watcher = watcher
+            watcher = _watcher
+    current = watcher.current
+    return current[1] if current else load_model()
+
+def main(argv):
+    registry = ModelRegistry()
+    if not registry.enabled:
+        print("MODEL_REGISTRY_DIR is empty; no registry.")
+        return 1
+    if argv[:1] == ["activate"] and len(argv) == 2:
+        try:
+            registry.activate(argv[1])
+        except ValueError as e:
+            print(e)
+            return 1
+        print(f"Current model is now {argv[1]}.")
+        return 0
+    if argv:
+        print("usage: python model_store.py [activate <version>]")
+        return 1
+    current = registry.current_version()
+    for version in registry.versions():
+        try:
+            m = registry.manifest(version)
+        except (OSError, ValueError):
+            continue
+        marker = "*" if version == current else " "
+        metrics = " ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in m.get("metrics", {}).items())
+        print(f"{marker} {version} engine={m['meta'].get('engine')} features={len(m['names'])} {metrics}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,128 @@
+"""
+Multi-resolution window pyramid computed from a single pass over the lines.
+
+The finest level is aggregated once into epoch-aligned buckets (line count,
+length sum, error/warn counts, max line length and a HyperLogLog sketch of the
+distinct lines). Every coarser level is derived from those buckets by rolling
+reductions — sums for counts, max for max length, register-wise max (sketch
+union) for distinct lines — so short spikes and slow drifts are covered in
+roughly the time of one featurization.
+
+Row i of the result describes, for every level, the window of that level's
+width ending with fine bucket i.
+"""
+
+import numpy as np
+import windowing
+import distinct
+
+PYRAMID_FEATURES = ["lines_per_sec", "avg_len", "errors_per_sec", "warns_per_sec", "max_len", "uniq"]
+
+def parse_levels(spec):
+    """
+    "10,60,900" -> [10, 60, 900]; every level must be a multiple of the finest.
+    """
+    levels = sorted({int(x) for x in spec.split(",") if x.strip()})
+    if not levels or levels[0] <= 0:
+        raise ValueError(f"invalid pyramid levels {spec!r}")
+    for lv in levels[1:]:
+        if lv % levels[0]:
+            raise ValueError(f"pyramid level {lv}s is not a multiple of the finest level {levels[0]}s")
+    return levels
+
+def rolling_sum(x, k):
+    """
+    out[i] = x[i-k+1] + ... + x[i] along axis 0 (missing leading rows count as 0).
+    """
+    cs = np.concatenate([np.zeros((1,) + x.shape[1:], dtype=x.dtype), np.cumsum(x, axis=0)])
+    lo = np.maximum(np.arange(1, len(x) + 1) - k, 0)
+    return cs[1:] - cs[lo]
+
+def rolling_max(x, k):
+    """
+    out[i] = max(x[i-k+1..i]) along axis 0 by doubling: O(n log k) vectorized maxima.
+    """
+    out = x.copy()
+    span = 1
+    while span * 2 <= k:
+        shifted = np.zeros_like(out)
+        shifted[span:] = out[:-span]
+        np.maximum(out, shifted, out=out)
+        span *= 2
+    rem = k - span
+    if rem:
+        shifted = np.zeros_like(out)
+        shifted[rem:] = out[:-rem]
+        np.maximum(out, shifted, out=out)
+    return out
+
+def _fine_buckets(ts, levels_s):
+    fine_ns = levels_s[0] * 1_000_000_000
+    starts, ends, t, next_start = windowing.time_window_bounds(ts, fine_ns, fine_ns)
+    k_max = levels_s[-1] // levels_s[0]
+    if len(starts):
+        # keep the coarsest level's history so the next run's first row is complete
+        history_start = int(t[-1]) + fine_ns - (k_max - 1) * fine_ns
+        next_start = min(next_start, int(np.searchsorted(ts, history_start, side="left")))
+    return starts, ends, t, next_start, k_max - 1
+
+def pyramid_windows(ts, levels_s):
+    """
+    Line index bounds of the coarsest window behind every pyramid row.
+    Returns (starts, ends, next_start) like windowing.time_window_bounds.
+    """
+    starts, ends, _, next_start, valid_from = _fine_buckets(ts, levels_s)
+    return starts[: max(len(starts) - valid_from, 0)], ends[valid_from:], next_start
+
+def pyramid_times(ts, levels_s):
+    """
+    [start, end) time bounds in ns of the coarsest window behind every pyramid row.
+    """
+    _, _, t, _, valid_from = _fine_buckets(ts, levels_s)
+    fine_ns = levels_s[0] * 1_000_000_000
+    t = t[valid_from:]
+    return t - valid_from * fine_ns, t + fine_ns
+
+def build_pyramid(batch, levels_s, ids=None, p=None):
+    """
+    Build the (n_rows, n_levels, n_features) pyramid tensor for `batch`, one row
+    per fine bucket whose coarsest window lies fully inside the batch.
+    """
+    starts, ends, _, _, valid_from = _fine_buckets(batch.ts, levels_s)
+    fine = levels_s[0]
+    n_buckets = len(starts)
+    tensor = np.zeros((n_buckets, len(levels_s), len(PYRAMID_FEATURES)))
+    if n_buckets == 0:
+        return tensor
+    lengths = windowing.char_lengths(batch)
+    counts = (ends - starts).astype(np.float64)
+    len_sum = windowing.window_sums(lengths, starts, ends).astype(np.float64)
+    is_error, is_warn = windowing.severity_flags(batch)
+    errors = windowing.window_sums(is_error, starts, ends).astype(np.float64)
+    warns = windowing.window_sums(is_warn, starts, ends).astype(np.float64)
+    # buckets are contiguous, so each non-empty bucket's reduceat segment ends at
+    # the next non-empty bucket's start; empty buckets stay 0
+    hi = int(ends[-1])
+    max_len = np.zeros(n_buckets)
+    nonempty = ends > starts
+    if nonempty.any():
+        max_len[nonempty] = np.maximum.reduceat(lengths[:hi], starts[nonempty])
+    ids = distinct.line_ids(batch) if ids is None else ids
+    bucket_of_line = np.repeat(np.arange(n_buckets), ends - starts)
+    regs = distinct.hll_registers(distinct.mix64(ids[starts[0]:hi]), bucket_of_line, n_buckets, p)
+    for li, level in enumerate(levels_s):
+        k = level // fine
+        c = rolling_sum(counts, k)
+        tensor[:, li, 0] = c / level
+        tensor[:, li, 1] = np.divide(rolling_sum(len_sum, k), c, out=np.zeros(n_buckets), where=c > 0)
+        tensor[:, li, 2] = rolling_sum(errors, k) / level
+        tensor[:, li, 3] = rolling_sum(warns, k) / level
+        tensor[:, li, 4] = rolling_max(max_len, k)
+        tensor[:, li, 5] = np.where(c > 0, distinct.hll_estimate(rolling_max(regs, k)), 0.0)
+    return tensor[valid_from:]
+
+def feature_names(levels_s):
+    """
+    Column names of the flattened (n_rows, n_levels * n_features) matrix.
+    """
+    return [f"{level}s_{name}" for level in levels_s for name in PYRAMID_FEATURES]
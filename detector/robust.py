@@ -0,0 +1,158 @@
+"""
+Lightweight anomaly detection with robust statistics, in pure NumPy.
+
+Every feature is standardized against the median and MAD (median absolute
+deviation, scaled by 1.4826 to match a normal standard deviation) of a
+reference set of windows: z = (x - median) / (1.4826 * MAD). A window is
+anomalous when any feature's robust z-score exceeds ROBUST_Z_LIMIT (a spike),
+or when the EWMA of a feature's z-scores (clipped to +-ROBUST_Z_LIMIT, so a
+single spike does not carry over) over consecutive windows leaves its
+control limits, ROBUST_EWMA_L robust standard deviations around the EWMA's
+median on the reference (a sustained shift too small to flag any single
+window). The limits are widened where needed so that at most `contamination`
+of the reference windows are flagged. The EWMA recurrence is unrolled by
+doubling (see ewma), so scoring n windows is a handful of vectorized passes
+with no Python loop over rows, and fitting is one median/MAD pass plus one
+EWMA pass.
+
+RobustDetector follows the IsolationForest API used by the detector (fit,
+score_samples — higher is more normal — predict -> -1/1, offset_) and, like
+hstrees.HalfSpaceTrees, adds partial_fit_predict for streams: the reference
+is then the rolling median/MAD of the last ROBUST_HISTORY windows and the EWMA
+carries over between batches. Nothing here needs scikit-learn.
+
+Environment variables:
+ - ROBUST_HISTORY (windows in the rolling reference, default 1000)
+ - ROBUST_Z_LIMIT (robust z-score limit per window, default 3.5)
+ - ROBUST_EWMA_ALPHA (EWMA smoothing factor, default 0.2)
+ - ROBUST_EWMA_L (EWMA control limit width in standard deviations, default 3)
+"""
+
+import os
+import numpy as np
+
+ROBUST_HISTORY = int(os.environ.get("ROBUST_HISTORY", "1000"))
+ROBUST_Z_LIMIT = float(os.environ.get("ROBUST_Z_LIMIT", "3.5"))
+ROBUST_EWMA_ALPHA = float(os.environ.get("ROBUST_EWMA_ALPHA", "0.2"))
+ROBUST_EWMA_L = float(os.environ.get("ROBUST_EWMA_L", "3"))
+
+_MAD_SCALE = 1.4826      # MAD -> standard deviation for normal data
+_MEAN_AD_SCALE = 1.2533  # mean absolute deviation -> standard deviation for normal data
+
+def ewma(z, alpha, initial=None):
+    """
+    out[i] = alpha * z[i] + (1 - alpha) * out[i-1] along axis 0, with out[-1] =
+    initial (default 0). The recurrence is unrolled by doubling: after the step
+    with span s every row holds the terms of the 2s rows ending at it, and the
+    steps stop once (1 - alpha)**s no longer changes a float64.
+    """
+    decay = 1.0 - alpha
+    out = alpha * np.asarray(z, dtype=np.float64)
+    if initial is not None and len(out):
+        out[0] += decay * initial
+    span, factor = 1, decay
+    while span < len(out) and factor > 1e-17:
+        out[span:] += factor * out[:-span]
+        span *= 2
+        factor *= factor
+    return out
+
+def robust_scale(X):
+    """
+    Per-column (median, scale) of X. The scale is 1.4826 * MAD, but at least
+    the scaled mean absolute deviation: the MAD of coarse count features
+    jumps between steps (or is 0 when most windows are equal) and would
+    understate their spread. Constant columns get scale 1.
+    """
+    center = np.median(X, axis=0)
+    dev = np.abs(X - center)
+    scale = np.maximum(_MAD_SCALE * np.median(dev, axis=0), _MEAN_AD_SCALE * dev.mean(axis=0))
+    scale[scale == 0] = 1.0
+    return center, scale
+
+class RobustDetector:
+    def __init__(self, history=None, z_limit=None, alpha=None, ewma_l=None, contamination=0.05):
+        self.history = history or ROBUST_HISTORY
+        self.z_limit = z_limit or ROBUST_Z_LIMIT
+        self.alpha = alpha or ROBUST_EWMA_ALPHA
+        self.ewma_l = ewma_l or ROBUST_EWMA_L
+        self.contamination = contamination
+        self.center_ = None       # (n_features,) reference median
+        self.scale_ = None        # (n_features,) reference robust standard deviation
+        self.ewma_center_ = None  # (n_features,) median of the reference's EWMA of z
+        self.ewma_scale_ = None   # (n_features,) robust standard deviation of that EWMA
+        self.ewma_ = None         # (n_features,) EWMA of z after the last streamed row
+        self.offset_ = -1.0       # score_samples below this is anomalous
+        self._reference = None    # last `history` rows the streaming reference is computed from
+
+    def _severity(self, X, initial=None):
+        """
+        Per row: the largest |z| / z_limit or EWMA deviation / control limit
+        over all features (> 1 is out of control), and the EWMA of the last row.
+        """
+        z = (X - self.center_) / self.scale_
+        # the EWMA is fed winsorized z-scores: a spike is flagged on its own
+        # window by the z limit, and must not hold the EWMA up for the next ones
+        e = ewma(np.clip(z, -self.z_limit, self.z_limit), self.alpha, self.ewma_center_ if initial is None else initial)
+        severity = np.maximum(
+            np.abs(z).max(axis=1, initial=0.0) / self.z_limit,
+            (np.abs(e - self.ewma_center_) / (self.ewma_l * self.ewma_scale_)).max(axis=1, initial=0.0),
+        )
+        return severity, (e[-1] if len(e) else initial)
+
+    def _calibrate(self, reference):
+        """
+        Median/MAD, EWMA control limits and offset_ from the reference rows.
+        """
+        self.center_, self.scale_ = robust_scale(reference)
+        # the EWMA of skewed or autocorrelated features does not settle at 0 with
+        # spread sqrt(alpha / (2 - alpha)), so its limits are measured on the reference
+        z = np.clip((reference - self.center_) / self.scale_, -self.z_limit, self.z_limit)
+        self.ewma_center_, self.ewma_scale_ = robust_scale(ewma(z, self.alpha))
+        # the control limits are the floor; skewed features must not flag more
+        # than `contamination` of the reference
+        severity = self._severity(reference)[0]
+        self.offset_ = min(-1.0, -np.percentile(severity, 100.0 * (1.0 - self.contamination)))
+
+    def score_samples(self, X):
+        """
+        Negated severity of every row against the reference, the rows taken as
+        one sequence for the EWMA; higher is more normal.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if self.center_ is None:
+            return np.zeros(X.shape[0])
+        return -self._severity(X)[0]
+
+    def predict(self, X):
+        """
+        -1 for rows outside the control limits, 1 otherwise.
+        """
+        return np.where(self.score_samples(X) < self.offset_, -1, 1)
+
+    def fit(self, X):
+        """
+        Take X as the reference: one median/MAD pass plus one EWMA pass.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        self._reference = X[-self.history:].copy()
+        self._calibrate(X)
+        self.ewma_ = self.ewma_center_.copy()
+        return self
+
+    def partial_fit_predict(self, X):
+        """
+        Score the rows against the rolling reference, continuing the EWMA from
+        the previous batch, then roll them into the reference. The first batch
+        is its own reference. Returns -1/1 predictions in row order.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if not len(X):
+            return np.ones(0, dtype=np.int64)
+        if self.center_ is None:
+            self.fit(X)
+        severity, self.ewma_ = self._severity(X, self.ewma_)
+        preds = np.where(-severity < self.offset_, -1, 1)
+        self._reference = np.concatenate([self._reference, X])[-self.history:]
+        self._calibrate(self._reference)
+        return preds
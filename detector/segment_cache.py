@@ -0,0 +1,125 @@
+"""
+On-disk LRU cache of fetched Loki ranges.
+
+Ranges are cut into SEGMENT_SECONDS segments aligned to the epoch, so
+overlapping runs (reruns, backtests) map onto the same keys. Each closed
+segment is stored as a compressed .npz of its LogBatch columns under
+sha1(query)_<segment start ns>. Segments that are still open — or closed less
+than SEGMENT_CACHE_SETTLE_SECONDS ago, since Loki can still ingest late lines
+for them — are never cached. When the directory grows beyond
+SEGMENT_CACHE_MAX_BYTES the least recently used segments are evicted.
+
+Environment variables:
+ - SEGMENT_CACHE_DIR (default /tmp/detector_segments; empty disables the cache)
+ - SEGMENT_CACHE_MAX_BYTES (default 268435456)
+ - SEGMENT_SECONDS (segment width in seconds, default 60)
+ - SEGMENT_CACHE_SETTLE_SECONDS (default 60)
+"""
+
+import os
+import time
+import hashlib
+import threading
+import numpy as np
+from logbatch import LogBatch
+
+SEGMENT_CACHE_DIR = os.environ.get("SEGMENT_CACHE_DIR", "/tmp/detector_segments")
+SEGMENT_CACHE_MAX_BYTES = int(os.environ.get("SEGMENT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+SEGMENT_SECONDS = int(os.environ.get("SEGMENT_SECONDS", "60"))
+SEGMENT_CACHE_SETTLE_SECONDS = int(os.environ.get("SEGMENT_CACHE_SETTLE_SECONDS", "60"))
+
+class SegmentCache:
+    def __init__(self, directory=None, max_bytes=None, segment_seconds=None, settle_seconds=None):
+        self.directory = SEGMENT_CACHE_DIR if directory is None else directory
+        self.max_bytes = max_bytes or SEGMENT_CACHE_MAX_BYTES
+        self.segment_ns = (segment_seconds or SEGMENT_SECONDS) * 1_000_000_000
+        self.settle_ns = (SEGMENT_CACHE_SETTLE_SECONDS if settle_seconds is None else settle_seconds) * 1_000_000_000
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def segments(self, start_ns, end_ns):
+        """
+        Aligned segment start times covering [start_ns, end_ns).
+        """
+        first = start_ns - start_ns % self.segment_ns
+        return list(range(first, end_ns, self.segment_ns))
+
+    def is_closed(self, seg_start, now_ns=None):
+        now_ns = time.time_ns() if now_ns is None else now_ns
+        return seg_start + self.segment_ns + self.settle_ns <= now_ns
+
+    def _path(self, query, seg_start):
+        key = hashlib.sha1(query.encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{key}_{seg_start}.npz")
+
+    def get(self, query, seg_start):
+        """
+        Return the cached LogBatch for a segment, or None on a miss.
+        """
+        path = self._path(query, seg_start)
+        try:
+            with np.load(path) as z:
+                batch = LogBatch(z["ts"], z["data"], z["offsets"])
+            os.utime(path)  # mtime doubles as the LRU clock
+        except (OSError, KeyError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return batch
+
+    def put(self, query, seg_start, batch, now_ns=None):
+        """
+        Store a closed segment; open or unsettled segments are ignored.
+        """
+        if not self.is_closed(seg_start, now_ns):
+            return False
+        path = self._path(query, seg_start)
+        tmp = f"{path}.{threading.get_ident()}.tmp.npz"
+        try:
+            np.savez_compressed(tmp, ts=batch.ts, data=batch.data, offsets=batch.offsets)
+            os.replace(tmp, path)
+        except OSError as e:
+            print("Failed to write segment cache:", e)
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """
+        Delete least recently used segments until the cache fits max_bytes.
+        """
+        with self._lock:
+            files = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".npz") or ".tmp" in name:
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    self.evictions += 1
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,153 @@
+"""
+Live streaming ingest through Loki's /loki/api/v1/tail WebSocket.
+
+ - LokiTailer subscribes to the tail endpoint in a background thread and pushes
+   (ts_ns, line) entries into a RingBuffer
+ - After a disconnect it backs off, backfills the gap through query_range
+   (via the `backfill` callable it is given) and resubscribes from there
+ - The windowing stage reads RingBuffer.snapshot() between detection passes
+
+Environment variables:
+ - STREAM_BUFFER_LINES (ring buffer capacity in lines, default 10000)
+ - STREAM_RECONNECT_MAX_SECONDS (max reconnect backoff, default 30)
+"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from urllib.parse import urlencode
+import websocket
+
+STREAM_BUFFER_LINES = int(os.environ.get("STREAM_BUFFER_LINES", "10000"))
+STREAM_RECONNECT_MAX_SECONDS = float(os.environ.get("STREAM_RECONNECT_MAX_SECONDS", "30"))
+
+class RingBuffer:
+    """
+    Bounded, thread-safe buffer of the most recent (ts_ns, line) entries.
+    `total` counts every entry ever appended, so readers can tell which
+    entries arrived since their last snapshot.
+    """
+
+    def __init__(self, capacity=None):
+        self._entries = deque(maxlen=capacity or STREAM_BUFFER_LINES)
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def extend(self, entries):
+        with self._lock:
+            self._entries.extend(entries)
+            self.total += len(entries)
+
+    def snapshot(self):
+        """
+        Return (entries, total) — a copy of the buffered entries and the running total.
+        """
+        with self._lock:
+            return list(self._entries), self.total
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+def tail_url(loki_url, query, start_ns=None):
+    base = loki_url.replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+    params = {"query": query}
+    if start_ns is not None:
+        params["start"] = start_ns
+    return f"{base}/loki/api/v1/tail?{urlencode(params)}"
+
+def parse_tail_message(message):
+    """
+    Parse one tail frame into a sorted list of (ts_ns, line).
+    """
+    data = json.loads(message)
+    entries = []
+    for stream in data.get("streams") or []:
+        for ts, line in stream.get("values", []):
+            entries.append((int(ts), line))
+    dropped = data.get("dropped_entries") or []
+    if dropped:
+        print(f"Loki tail dropped {len(dropped)} entries (consumer too slow).")
+    entries.sort(key=lambda x: x[0])
+    return entries
+
+class LokiTailer(threading.Thread):
+    """
+    Background thread keeping `buffer` fed from Loki's tail endpoint.
+    `backfill(query, start_ns, end_ns)` must return sorted (ts_ns, line) entries
+    and is used to recover lines missed while disconnected. `buffered` are
+    entries already in the buffer at start_ns; Loki replays them on subscribe.
+    """
+
+    def __init__(self, loki_url, query, buffer, backfill, start_ns=None, buffered=()):
+        super().__init__(daemon=True)
+        self.loki_url = loki_url
+        self.query = query
+        self.buffer = buffer
+        self.backfill = backfill
+        self.last_ts_ns = start_ns
+        self._boundary = {e for e in buffered if e[0] == start_ns}  # entries already buffered at last_ts_ns
+        self._stop_event = threading.Event()
+        self.reconnects = 0
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _push(self, entries):
+        fresh = []
+        for ts, line in entries:
+            if self.last_ts_ns is not None:
+                if ts < self.last_ts_ns or (ts == self.last_ts_ns and (ts, line) in self._boundary):
+                    continue
+            if ts != self.last_ts_ns:
+                self.last_ts_ns = ts
+                self._boundary = set()
+            self._boundary.add((ts, line))
+            fresh.append((ts, line))
+        if fresh:
+            self.buffer.extend(fresh)
+
+    def _fill_gap(self):
+        if self.last_ts_ns is None:
+            return
+        end_ns = time.time_ns()
+        try:
+            entries = self.backfill(self.query, self.last_ts_ns, end_ns)
+            self._push(entries)
+            print(f"Backfilled {len(entries)} lines after tail disconnect.")
+        except Exception as e:
+            print("Tail gap backfill failed:", e)
+
+    def _consume(self, ws):
+        while not self._stop_event.is_set():
+            try:
+                message = ws.recv()
+            except websocket.WebSocketTimeoutException:
+                continue
+            if not message:
+                raise websocket.WebSocketConnectionClosedException("tail connection closed")
+            self._push(parse_tail_message(message))
+
+    def run(self):
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            ws = None
+            try:
+                if self.reconnects:
+                    self._fill_gap()
+                ws = websocket.create_connection(tail_url(self.loki_url, self.query, self.last_ts_ns), timeout=10)
+                ws.settimeout(1)
+                backoff = 1.0
+                self._consume(ws)
+            except Exception as e:
+                if self._stop_event.is_set():
+                    break
+                print(f"Loki tail disconnected ({e}); reconnecting in {backoff:.0f}s.")
+                self.reconnects += 1
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, STREAM_RECONNECT_MAX_SECONDS)
+            finally:
+                if ws is not None:
+                    ws.close()
@@ -0,0 +1,37 @@
+"""
+Per-window template-frequency features as a sparse matrix.
+
+Every line carries a mined template id (see templates.py). For each sliding
+window, the count of every template in it becomes one row of a
+scipy.sparse CSR matrix (windows x templates), built in one vectorized pass
+over (window, line) memberships without any dense windows x templates array,
+so thousands of templates stay cheap. IsolationForest consumes CSR input directly.
+"""
+
+import numpy as np
+from scipy import sparse
+
+def template_count_matrix(template_ids, starts, ends, n_templates):
+    """
+    CSR matrix whose row k counts template_ids[starts[k]:ends[k]] per template.
+    """
+    template_ids = np.asarray(template_ids, dtype=np.int64)
+    n_templates = max(int(n_templates), int(template_ids.max()) + 1 if len(template_ids) else 0, 1)
+    sizes = ends - starts
+    if not len(template_ids) or not sizes.sum():
+        return sparse.csr_matrix((len(starts), n_templates))
+    # one entry per (window, line) membership: window k owns lines starts[k]..ends[k)-1
+    window = np.repeat(np.arange(len(starts), dtype=np.int64), sizes)
+    line = np.arange(int(sizes.sum()), dtype=np.int64) - np.repeat(np.cumsum(sizes) - sizes - starts, sizes)
+    keys = window * n_templates + template_ids[line]
+    keys, counts = np.unique(keys, return_counts=True)
+    rows, cols = np.divmod(keys, n_templates)
+    return sparse.csr_matrix((counts.astype(np.float64), (rows, cols)), shape=(len(starts), n_templates))
+
+def top_templates(matrix, row, k=3):
+    """
+    (template_id, count) pairs of the k most frequent templates in one window.
+    """
+    r = matrix.getrow(row)
+    order = np.argsort(-r.data, kind="stable")[:k]
+    return [(int(r.indices[i]), int(r.data[i])) for i in order]
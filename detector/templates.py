@@ -0,0 +1,173 @@
+"""
+Online log template mining (Drain-style).
+
+Each line is first masked (timestamps, UUIDs, IPs, hex and decimal numbers become
+placeholders), then looked up in a cache of already-seen masked lines. Cache
+misses walk a fixed-depth prefix tree — token count, then the first
+TEMPLATE_TREE_DEPTH - 2 tokens — to a short list of candidate templates; the
+most similar one above TEMPLATE_SIM_THRESHOLD absorbs the line (differing
+tokens become <*>), otherwise a new template is created. Template IDs are
+compact, stable integers, stored on a LogBatch as the int32 "template_id"
+column. Mining works directly on the batch's UTF-8 bytes.
+
+Environment variables:
+ - TEMPLATE_TREE_DEPTH (default 4)
+ - TEMPLATE_SIM_THRESHOLD (default 0.4)
+ - TEMPLATE_MAX_CHILDREN (default 100)
+ - TEMPLATE_CACHE_SIZE (masked lines remembered, default 100000)
+ - TEMPLATE_STATE_PATH (persisted miner state, default /tmp/detector_templates.json; empty disables)
+"""
+
+import os
+import re
+import json
+import numpy as np
+
+TEMPLATE_TREE_DEPTH = int(os.environ.get("TEMPLATE_TREE_DEPTH", "4"))
+TEMPLATE_SIM_THRESHOLD = float(os.environ.get("TEMPLATE_SIM_THRESHOLD", "0.4"))
+TEMPLATE_MAX_CHILDREN = int(os.environ.get("TEMPLATE_MAX_CHILDREN", "100"))
+TEMPLATE_CACHE_SIZE = int(os.environ.get("TEMPLATE_CACHE_SIZE", "100000"))
+TEMPLATE_STATE_PATH = os.environ.get("TEMPLATE_STATE_PATH", "/tmp/detector_templates.json")
+
+WILDCARD = b"<*>"
+
+_MASKS = [
+    (re.compile(rb"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?Z?"), b"<TS>"),
+    (re.compile(rb"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), b"<UUID>"),
+    (re.compile(rb"\b0[xX][0-9a-fA-F]+\b"), b"<HEX>"),
+    # numbers starting at a word boundary; also covers decimals, IPs and host:port
+    (re.compile(rb"\b\d+(?:\.\d+)*(?::\d+)?"), b"<NUM>"),
+]
+_HAS_DIGIT = re.compile(rb"\d")
+
+def mask_line(raw):
+    """
+    Replace variable tokens in a raw (bytes) line with placeholders.
+    """
+    for pattern, repl in _MASKS:
+        raw = pattern.sub(repl, raw)
+    return raw
+
+class TemplateMiner:
+    def __init__(self, depth=None, sim_threshold=None, max_children=None, cache_size=None):
+        self.depth = max(3, depth or TEMPLATE_TREE_DEPTH)
+        self.sim_threshold = TEMPLATE_SIM_THRESHOLD if sim_threshold is None else sim_threshold
+        self.max_children = max_children or TEMPLATE_MAX_CHILDREN
+        self.cache_size = cache_size or TEMPLATE_CACHE_SIZE
+        self.templates = []  # template id -> list of byte tokens
+        self.counts = []  # template id -> lines assigned
+        self.root = {}
+        self.cache = {}  # masked line -> template id
+
+    def __len__(self):
+        return len(self.templates)
+
+    def template(self, tid):
+        return b" ".join(self.templates[tid]).decode("utf-8", "replace")
+
+    def _leaf(self, tokens):
+        node = self.root.setdefault(len(tokens), {})
+        for tok in tokens[:self.depth - 2]:
+            key = WILDCARD if _HAS_DIGIT.search(tok) else tok
+            if key not in node:
+                key = key if len(node) < self.max_children else WILDCARD
+            node = node.setdefault(key, {})
+        return node.setdefault(None, [])  # the None key holds the leaf's template ids
+
+    def _similarity(self, template, tokens):
+        same = 0
+        params = 0
+        for a, b in zip(template, tokens):
+            if a == WILDCARD:
+                params += 1
+            elif a == b:
+                same += 1
+        return same / len(tokens) if tokens else 1.0, params
+
+    def _match(self, tokens):
+        leaf = self._leaf(tokens)
+        best, best_key = None, None
+        for tid in leaf:
+            sim, params = self._similarity(self.templates[tid], tokens)
+            if sim >= self.sim_threshold and (best_key is None or (sim, params) > best_key):
+                best, best_key = tid, (sim, params)
+        if best is None:
+            best = len(self.templates)
+            self.templates.append(list(tokens))
+            self.counts.append(0)
+            leaf.append(best)
+        else:
+            tmpl = self.templates[best]
+            for i, (a, b) in enumerate(zip(tmpl, tokens)):
+                if a != b:
+                    tmpl[i] = WILDCARD
+        return best
+
+    def add(self, raw):
+        """
+        Assign a template id to one raw (bytes) line, learning as needed.
+        """
+        masked = mask_line(raw)
+        tid = self.cache.get(masked)
+        if tid is None:
+            tid = self._match(masked.split())
+            if len(self.cache) < self.cache_size:
+                self.cache[masked] = tid
+        self.counts[tid] += 1
+        return tid
+
+    def assign(self, batch):
+        """
+        Mine every line of a LogBatch; stores and returns the int32 "template_id" column.
+        """
+        raw = batch.data.tobytes()
+        offs = batch.offsets.tolist()
+        add = self.add
+        ids = np.array([add(raw[a:b]) for a, b in zip(offs, offs[1:])], dtype=np.int32)
+        batch.columns["template_id"] = ids
+        return ids
+
+    def to_dict(self):
+        return {
+            "depth": self.depth,
+            "sim_threshold": self.sim_threshold,
+            "max_children": self.max_children,
+            "templates": [[t.decode("utf-8", "surrogateescape") for t in tmpl] for tmpl in self.templates],
+            "counts": self.counts,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        miner = cls(state["depth"], state["sim_threshold"], state["max_children"])
+        for tmpl, count in zip(state["templates"], state["counts"]):
+            tokens = [t.encode("utf-8", "surrogateescape") for t in tmpl]
+            tid = len(miner.templates)
+            miner.templates.append(tokens)
+            miner.counts.append(count)
+            miner._leaf(tokens).append(tid)
+        return miner
+
+def load_miner(path=None):
+    """
+    Load the persisted miner so template ids stay stable across runs, or start fresh.
+    """
+    path = TEMPLATE_STATE_PATH if path is None else path
+    if path and os.path.exists(path):
+        try:
+            with open(path) as f:
+                return TemplateMiner.from_dict(json.load(f))
+        except Exception as e:
+            print("Ignoring unreadable template state:", e)
+    return TemplateMiner()
+
+def save_miner(miner, path=None):
+    path = TEMPLATE_STATE_PATH if path is None else path
+    if not path:
+        return
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(miner.to_dict(), f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print("Failed to write template state:", e)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the detector is a flat directory of modules; keep runs away from /tmp state
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for name in ("SEGMENT_CACHE_DIR", "CHECKPOINT_PATH", "FEATURE_STORE_DIR", "MODEL_PATH", "MODEL_REGISTRY_DIR", "ENGINE_STATE_PATH"):
+    os.environ.setdefault(name, "")
+os.environ.setdefault("HTTP_RETRIES", "0")
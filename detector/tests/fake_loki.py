@@ -0,0 +1,112 @@
+"""
+Local stand-ins for Loki on ephemeral ports.
+
+FakeLoki serves query_range from a threaded http.server: it returns the
+configured (ts_ns, line) entries in [start, end) in forward order, at most
+`limit` per response, and records every request's parameters. FakeLokiTail
+serves the tail WebSocket.
+"""
+
+import json
+import base64
+import socket
+import struct
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+class FakeLoki:
+    def __init__(self, entries):
+        self.entries = sorted(entries)
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                fake.requests.append(params)
+                start, end, limit = int(params["start"]), int(params["end"]), int(params["limit"])
+                values = [[str(ts), line] for ts, line in fake.entries if start <= ts < end][:limit]
+                body = json.dumps({
+                    "status": "success",
+                    "data": {"resultType": "streams", "result": [{"stream": {"job": "app"}, "values": values}]},
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+class FakeLokiTail:
+    """
+    Stand-in for Loki's /loki/api/v1/tail WebSocket: a plain socket server
+    doing the upgrade handshake, then sending `entries` with ts >= the
+    requested start as one text frame per `batch` entries, and closing the
+    connection. Every request path is recorded.
+    """
+
+    def __init__(self, entries, batch=2):
+        self.entries = sorted(entries)
+        self.batch = batch
+        self.paths = []
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{self.sock.getsockname()[1]}"
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with conn:
+                request = b""
+                while b"\r\n\r\n" not in request:
+                    request += conn.recv(4096)
+                head = request.decode().split("\r\n")
+                path = head[0].split(" ")[1]
+                self.paths.append(path)
+                key = next(h.split(":", 1)[1].strip() for h in head if h.lower().startswith("sec-websocket-key"))
+                accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+                conn.sendall(
+                    "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                    f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+                )
+                start = int(parse_qs(urlparse(path).query)["start"][0])
+                values = [[str(ts), line] for ts, line in self.entries if ts >= start]
+                for i in range(0, len(values), self.batch):
+                    _send_text(conn, json.dumps({"streams": [{"stream": {"job": "app"}, "values": values[i:i + self.batch]}]}))
+                conn.sendall(b"\x88\x00")  # close frame
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.sock.close()
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+def _send_text(conn, text):
+    payload = text.encode()
+    if len(payload) < 126:
+        header = struct.pack("!BB", 0x81, len(payload))
+    else:
+        header = struct.pack("!BBQ", 0x81, 127, len(payload))
+    conn.sendall(header + payload)
@@ -0,0 +1,31 @@
+import numpy as np
+import feature_store
+
+T0 = 1_700_000_000_000_000_000
+SEC = 1_000_000_000
+
+def store(tmp_path, compact_parts=8):
+    # T0 is long past the default retention
+    return feature_store.FeatureStore(str(tmp_path), retention_days=100_000, compact_parts=compact_parts)
+
+def test_windows_sharing_a_start_are_all_kept(tmp_path):
+    s = store(tmp_path)
+    names = ["a"]
+    # two line windows starting at the same timestamp
+    bounds = np.array([[T0, T0 + 5 * SEC], [T0, T0 + 9 * SEC], [T0 + SEC, T0 + 9 * SEC]])
+    s.append(names, np.array([[1.0], [2.0], [3.0]]), bounds)
+    # a rerun recomputes the second window
+    s.append(names, np.array([[4.0]]), bounds[1:2])
+    features, got = s.load(names)
+    assert got.tolist() == bounds.tolist()
+    assert features[:, 0].tolist() == [1.0, 4.0, 3.0]
+
+def test_compaction_keeps_windows_sharing_a_start(tmp_path):
+    s = store(tmp_path, compact_parts=1)
+    names = ["a"]
+    s.append(names, np.array([[1.0]]), np.array([[T0, T0 + 5 * SEC]]))
+    s.append(names, np.array([[2.0]]), np.array([[T0, T0 + 9 * SEC]]))
+    day = s.days(names)[0]
+    assert len(s.parts(names, day)) == 1
+    features, _ = s.load(names)
+    assert features[:, 0].tolist() == [1.0, 2.0]
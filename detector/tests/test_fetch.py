@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+import detector
+import segment_cache
+from fake_loki import FakeLoki
+
+T0 = 1_700_000_000_000_000_000
+SEC = 1_000_000_000
+
+@pytest.fixture
+def loki(monkeypatch):
+    servers = []
+
+    def start(entries):
+        fake = FakeLoki(entries).__enter__()
+        servers.append(fake)
+        monkeypatch.setattr(detector, "LOKI_URL", fake.url)
+        return fake
+
+    yield start
+    for fake in servers:
+        fake.__exit__()
+
+def test_paging_keeps_every_entry_at_repeated_page_boundary_timestamps(loki):
+    # runs of 3 lines share a timestamp, so pages of 4 always end inside a run
+    entries = [(T0 + (i // 3) * SEC, f"line {i:04d}") for i in range(40)]
+    fake = loki(entries)
+    batch = detector.fetch_loki_range('{job="app"}', T0, T0 + 100 * SEC, page_size=4)
+    assert batch.entries() == entries
+    assert len(fake.requests) > 10
+    # every page resumes at the last timestamp it returned
+    assert all(int(r["start"]) >= T0 for r in fake.requests)
+
+def test_paging_steps_past_a_full_page_of_one_timestamp(loki):
+    entries = [(T0, f"same {i:04d}") for i in range(4)] + [(T0 + SEC, "next")]
+    loki(entries)
+    batch = detector.fetch_loki_range('{job="app"}', T0, T0 + 10 * SEC, page_size=4)
+    assert batch.entries() == entries
+
+def test_shards_merge_in_timestamp_order(loki):
+    entries = [(T0 + i * SEC // 2, f"line {i:04d}") for i in range(200)]
+    fake = loki(entries)
+    batch = detector.fetch_loki_sharded('{job="app"}', T0, T0 + 100 * SEC, shards=4, workers=4)
+    assert batch.entries() == entries
+    assert len({r["start"] for r in fake.requests}) >= 4
+
+def test_line_budget_keeps_a_prefix(loki):
+    entries = [(T0 + i * SEC // 10, f"line {i:04d}") for i in range(500)]
+    loki(entries)
+    budget = detector.FetchBudget(max_lines=120)
+    batch = detector.fetch_loki_range('{job="app"}', T0, T0 + 100 * SEC, page_size=50, budget=budget)
+    assert batch.entries() == entries[:120]
+    assert budget.exhausted
+
+def test_byte_budget_keeps_a_prefix(loki):
+    entries = [(T0 + i * SEC // 10, "x" * 10) for i in range(500)]
+    loki(entries)
+    batch = detector.fetch_loki_range('{job="app"}', T0, T0 + 100 * SEC, page_size=50, max_bytes=255)
+    assert len(batch) == 25
+    assert batch.entries() == entries[:25]
+
+def test_sharded_budget_keeps_as_much_as_one_fetch(loki):
+    entries = [(T0 + i * SEC // 10, f"line {i:04d}") for i in range(1000)]
+    loki(entries)
+    budget = detector.FetchBudget(max_lines=300)
+    batch = detector.fetch_loki_sharded('{job="app"}', T0, T0 + 100 * SEC, shards=4, workers=4, budget=budget)
+    assert budget.exhausted
+    # the same gap-free prefix as an unsharded fetch
+    assert batch.entries() == entries[:300]
+    assert np.all(np.diff(batch.ts) > 0)
+
+def test_burst_in_one_shard_is_kept_when_the_total_fits(loki):
+    quiet = [(T0 + i * SEC, f"quiet {i:04d}") for i in range(0, 100, 10)]
+    burst = [(T0 + 30 * SEC + i * SEC // 1000, f"burst {i:04d}") for i in range(250)]
+    entries = sorted(quiet + burst)
+    loki(entries)
+    budget = detector.FetchBudget(max_lines=300)
+    batch = detector.fetch_loki_sharded('{job="app"}', T0, T0 + 100 * SEC, shards=4, workers=2, budget=budget)
+    assert not budget.exhausted
+    assert batch.entries() == entries
+
+def test_segment_cache_budget_keeps_a_prefix(loki, tmp_path):
+    entries = [(T0 + i * SEC // 10, f"line {i:04d}") for i in range(1000)]
+    fake = loki(entries)
+    cache = segment_cache.SegmentCache(str(tmp_path), segment_seconds=10, settle_seconds=0)
+    budget = detector.FetchBudget(max_lines=300)
+    batch = detector.fetch_loki_cached('{job="app"}', T0 + 5 * SEC, T0 + 100 * SEC, cache, workers=4, budget=budget)
+    assert batch.entries() == entries[50:350]
+    # complete segments were cached, and a second fetch serves them from disk
+    n_requests = len(fake.requests)
+    again = detector.fetch_loki_cached('{job="app"}', T0 + 5 * SEC, T0 + 100 * SEC, cache, workers=4,
+                                       budget=detector.FetchBudget(max_lines=300))
+    assert again.entries() == entries[50:350]
+    assert cache.stats()["hits"] >= 3
+    assert all(int(r["start"]) >= T0 + 30 * SEC for r in fake.requests[n_requests:])
+
+def test_byte_budget_charges_utf8_bytes(loki):
+    # 5 characters, 10 bytes each
+    entries = [(T0 + i * SEC // 10, "é" * 5) for i in range(100)]
+    loki(entries)
+    batch = detector.fetch_loki_range('{job="app"}', T0, T0 + 100 * SEC, page_size=50, max_bytes=255)
+    assert batch.entries() == entries[:25]
+    assert batch.byte_lengths().sum() <= 255
@@ -0,0 +1,110 @@
+import os
+import pytest
+import filetail
+
+def line(i):
+    return f"2024-01-01 00:00:{i % 60:02d},000 INFO line {i}\n".encode()
+
+def lines(a, b):
+    return b"".join(line(i) for i in range(a, b))
+
+def append(path, data):
+    with open(path, "ab") as f:
+        f.write(data)
+
+def rotate(base, backups=3):
+    # what RotatingFileHandler.doRollover does
+    for i in range(backups - 1, 0, -1):
+        if os.path.exists(f"{base}.{i}"):
+            os.replace(f"{base}.{i}", f"{base}.{i + 1}")
+    os.replace(base, f"{base}.1")
+    open(base, "wb").close()
+
+@pytest.fixture
+def log(tmp_path):
+    return str(tmp_path / "app.log")
+
+@pytest.fixture(params=["read", "mmap"])
+def read(request, monkeypatch):
+    monkeypatch.setattr(filetail, "MMAP_THRESHOLD_BYTES", 1 if request.param == "mmap" else 1 << 30)
+    return lambda state, base: filetail.read_new_lines(state, base=base, backups=3)
+
+def test_incomplete_last_line_waits_for_its_newline(log, read):
+    append(log, lines(0, 3) + b"2024-01-01 00:00:03,000 INFO par")
+    raw, state = read(None, log)
+    assert raw == lines(0, 3)
+    append(log, b"tial\n")
+    raw, state = read(state, log)
+    assert raw == b"2024-01-01 00:00:03,000 INFO partial\n"
+    assert read(state, log)[0] == b""
+
+def test_rotation_finishes_the_old_file_then_reads_the_new_one(log, read):
+    append(log, lines(0, 5))
+    _, state = read(None, log)
+    append(log, lines(5, 8))
+    rotate(log)
+    append(log, lines(8, 10))
+    raw, state = read(state, log)
+    assert raw == lines(5, 10)
+    assert state["inode"] == os.stat(log).st_ino
+
+def test_several_rotations_between_reads(log, read):
+    append(log, lines(0, 2))
+    _, state = read(None, log)
+    append(log, lines(2, 4))
+    rotate(log)
+    append(log, lines(4, 6))
+    rotate(log)
+    append(log, lines(6, 8))
+    raw, _ = read(state, log)
+    assert raw == lines(2, 8)
+
+def test_file_rotated_past_the_backups_reads_everything_left(log, read):
+    append(log, lines(0, 2))
+    _, state = read(None, log)
+    for i in range(2, 10, 2):
+        rotate(log)
+        append(log, lines(i, i + 2))
+    raw, _ = read(state, log)
+    # app.log.3 .. app.log: the oldest remaining backups first
+    assert raw == lines(2, 10)
+
+def test_truncation_in_place_restarts_at_the_beginning(log, read):
+    append(log, lines(0, 10))
+    _, state = read(None, log)
+    with open(log, "wb") as f:
+        f.write(lines(10, 12))
+    raw, state = read(state, log)
+    assert raw == lines(10, 12)
+    assert state["offset"] == len(lines(10, 12))
+
+def test_copytruncate_resumes_in_the_copy(log, read):
+    append(log, lines(0, 3))
+    _, state = read(None, log)
+    append(log, lines(3, 5))
+    # logrotate copytruncate: copy to app.log.1, truncate app.log in place
+    with open(log, "rb") as src, open(f"{log}.1", "wb") as dst:
+        dst.write(src.read())
+    open(log, "wb").close()
+    append(log, lines(5, 7))
+    raw, _ = read(state, log)
+    assert raw == lines(3, 7)
+
+def test_offset_round_trip(tmp_path):
+    path = str(tmp_path / "offset.json")
+    assert filetail.load_offset(path) is None
+    filetail.save_offset({"inode": 7, "offset": 42, "head": "abcd"}, path)
+    assert filetail.load_offset(path) == {"inode": 7, "offset": 42, "head": "abcd"}
+
+def test_state_without_head_matches_by_inode(log, read):
+    append(log, lines(0, 3))
+    _, state = read(None, log)
+    append(log, lines(3, 5))
+    rotate(log)
+    append(log, lines(5, 6))
+    raw, _ = read({"inode": state["inode"], "offset": state["offset"]}, log)
+    assert raw == lines(3, 6)
+
+def test_lines_to_batch_keeps_crlf_out_of_lines():
+    batch = filetail.lines_to_batch(line(0).replace(b"\n", b"\r\n") + line(1))
+    assert batch.lines() == [line(0).decode().rstrip("\n"), line(1).decode().rstrip("\n")]
@@ -0,0 +1,51 @@
+import json
+import pytest
+import loki_decode
+
+T0 = 1_700_000_000_000_000_000
+
+ENTRIES = [
+    (T0, "plain line"),
+    (T0 + 1, 'quoted "value" and back\\slash'),
+    (T0 + 2, "naïve café ✓ 日本語"),
+    (T0 + 3, "tab\there\nnewline \u0001 control"),
+    (T0 + 4, ""),
+]
+
+def response(streams, stats=True):
+    body = {
+        "status": "success",
+        "data": {
+            "resultType": "streams",
+            "result": [{"stream": {"job": "app", "level": lvl}, "values": [[str(ts), line] for ts, line in values]}
+                       for lvl, values in streams],
+        },
+    }
+    if stats:
+        body["data"]["stats"] = {"summary": {"bytesProcessedPerSecond": 123456, "execTime": 0.0125,
+                                             "ratio": -1.5e-3, "cached": True, "empty": False, "none": None}}
+    return json.dumps(body, ensure_ascii=False).encode()
+
+def decode(chunks):
+    return list(loki_decode.iter_query_range_values(chunks))
+
+BODY = response([("info", ENTRIES[:3]), ("warn", ENTRIES[3:])])
+
+def test_decodes_every_pair_in_one_chunk():
+    assert decode([BODY]) == ENTRIES
+
+def test_any_split_point_gives_the_same_pairs():
+    # splits inside numbers, literals, escapes and multi-byte UTF-8 sequences
+    for split in range(1, len(BODY)):
+        assert decode([BODY[:split], BODY[split:]]) == ENTRIES, f"split at byte {split}"
+
+def test_byte_at_a_time():
+    assert decode(BODY[i:i + 1] for i in range(len(BODY))) == ENTRIES
+
+def test_pretty_printed_response():
+    body = json.dumps(json.loads(BODY), indent=2).encode()
+    assert decode(body[i:i + 7] for i in range(0, len(body), 7)) == ENTRIES
+
+def test_truncated_response_raises():
+    with pytest.raises(ValueError):
+        decode([BODY[:len(BODY) // 2]])
@@ -0,0 +1,20 @@
+import numpy as np
+from robust import RobustDetector
+
+def normal_windows(n, seed=0):
+    return np.random.default_rng(seed).normal(100.0, 5.0, size=(n, 3))
+
+def test_single_spike_flags_only_its_own_window():
+    model = RobustDetector(contamination=0.01).fit(normal_windows(1000))
+    X = normal_windows(40, seed=1)
+    X[10, 0] = 100.0 + 50 * 5.0  # z of about 50
+    flagged = np.flatnonzero(model.predict(X) == -1)
+    assert flagged.tolist() == [10]
+
+def test_sustained_shift_is_flagged_by_the_ewma():
+    model = RobustDetector(contamination=0.01).fit(normal_windows(1000))
+    X = normal_windows(60, seed=2)
+    X[20:, 1] += 1.5 * 5.0  # 1.5 standard deviations: below the per-window z limit
+    flagged = model.predict(X) == -1
+    assert not flagged[:20].any()
+    assert flagged[30:].mean() > 0.5
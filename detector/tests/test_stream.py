@@ -0,0 +1,89 @@
+import time
+import pytest
+import stream
+import detector
+from logbatch import LogBatch
+from fake_loki import FakeLokiTail
+
+T0 = 1_700_000_000_000_000_000
+SEC = 1_000_000_000
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+def test_tail_does_not_rebuffer_prefilled_lines_at_the_start_timestamp():
+    prefilled = [(T0, "a"), (T0 + SEC, "b"), (T0 + SEC, "c")]
+    live = [(T0 + 2 * SEC, "d"), (T0 + 3 * SEC, "e")]
+    buffer = stream.RingBuffer(100)
+    buffer.extend(prefilled)
+    tail_start = prefilled[-1][0]
+    # Loki replays the entries at `start` on subscribe
+    with FakeLokiTail(prefilled + live) as fake:
+        tailer = stream.LokiTailer(fake.url, '{job="app"}', buffer, lambda q, s, e: [],
+                                   start_ns=tail_start, buffered=[e for e in prefilled if e[0] == tail_start])
+        tailer.start()
+        try:
+            assert wait_for(lambda: buffer.total >= 5)
+        finally:
+            tailer.stop()
+    entries, total = buffer.snapshot()
+    assert entries == prefilled + live
+    assert total == 5
+    assert f"start={tail_start}" in fake.paths[0]
+    assert fake.paths[0].startswith("/loki/api/v1/tail?")
+
+def test_tail_backfills_the_gap_after_a_disconnect():
+    first = [(T0, "a"), (T0 + SEC, "b")]
+    missed = [(T0 + SEC, "b"), (T0 + 2 * SEC, "c"), (T0 + 3 * SEC, "d")]
+    calls = []
+
+    def backfill(query, start_ns, end_ns):
+        calls.append(start_ns)
+        return [e for e in missed if e[0] >= start_ns]
+
+    buffer = stream.RingBuffer(100)
+    with FakeLokiTail(first) as fake:
+        tailer = stream.LokiTailer(fake.url, '{job="app"}', buffer, backfill, start_ns=T0)
+        tailer.start()
+        try:
+            # the stand-in closes after sending; the tailer reconnects and backfills from its watermark
+            assert wait_for(lambda: buffer.total >= 4 and tailer.reconnects >= 1)
+        finally:
+            tailer.stop()
+    entries, _ = buffer.snapshot()
+    assert entries == first + missed[1:]
+    assert calls[0] == T0 + SEC
+
+@pytest.mark.parametrize("mode", ["time", "pyramid"])
+def test_window_closed_by_the_first_line_of_a_pass_is_fresh(monkeypatch, mode):
+    monkeypatch.setattr(detector, "WINDOW_MODE", mode)
+    monkeypatch.setattr(detector, "WINDOW_SECONDS", 10)
+    monkeypatch.setattr(detector, "WINDOW_HOP_SECONDS", 10)
+    monkeypatch.setattr(detector, "PYRAMID_LEVELS", [10])
+    # pass 1 sees the lines of [T0, T0 + 10s); no window has elapsed yet
+    first = [(T0 + i * SEC, f"line {i}") for i in range(10)]
+    batch = LogBatch.from_entries(first)
+    assert not detector.fresh_windows(batch, 0, 0, None).any()
+    # pass 2's first line, exactly at the boundary, closes that window
+    second = first + [(T0 + 10 * SEC, "line 10")]
+    batch = LogBatch.from_entries(second)
+    fresh = detector.fresh_windows(batch, 0, len(first), first[-1][0])
+    assert fresh.tolist() == [True]
+    # pass 3 scores the next window only
+    third = second + [(T0 + i * SEC, f"line {i}") for i in range(11, 21)]
+    batch = LogBatch.from_entries(third)
+    fresh = detector.fresh_windows(batch, 0, len(second), second[-1][0])
+    assert fresh.tolist() == [False, True]
+
+def test_line_window_is_fresh_only_with_new_lines(monkeypatch):
+    monkeypatch.setattr(detector, "WINDOW_MODE", "lines")
+    monkeypatch.setattr(detector, "WINDOW_SIZE", 4)
+    monkeypatch.setattr(detector, "WINDOW_STEP", 4)
+    batch = LogBatch.from_entries([(T0 + i * SEC, f"line {i}") for i in range(12)])
+    # 8 lines were seen; the first 4 were evicted from the buffer
+    assert detector.fresh_windows(batch.slice(4), 4, 8, T0 + 7 * SEC).tolist() == [False, True]
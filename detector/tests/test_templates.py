@@ -0,0 +1,13 @@
+import numpy as np
+import template_features
+
+def test_windows_without_lines_keep_their_rows():
+    starts = np.array([0, 0, 0])
+    matrix = template_features.template_count_matrix(np.array([1, 2, 3]), starts, starts, 4)
+    assert matrix.shape == (3, 4)
+    assert matrix.nnz == 0
+
+def test_counts_per_window():
+    ids = np.array([0, 1, 1, 2, 1])
+    matrix = template_features.template_count_matrix(ids, np.array([0, 2]), np.array([3, 5]), 3)
+    assert matrix.toarray().tolist() == [[1, 2, 0], [0, 2, 1]]
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+import detector
+import feature_store
+import train
+from fake_loki import FakeLoki
+
+T0 = 1_700_000_000_000_000_000
+SEC = 1_000_000_000
+HOUR = 3600 * SEC
+
+@pytest.fixture
+def pyramid_loki(monkeypatch):
+    monkeypatch.setattr(detector, "WINDOW_MODE", "pyramid")
+    monkeypatch.setattr(detector, "PYRAMID_LEVELS", [10, 60, 300])
+    monkeypatch.setattr(detector, "FEATURE_MODE", "basic")
+    monkeypatch.setattr(detector, "_feature_registry", None)
+    monkeypatch.setattr(detector, "_feature_store", None)
+    monkeypatch.setattr(train, "TRAIN_CHUNK_HOURS", 1)
+    # one line every 2 seconds, from the coarsest level's history before T0 on
+    entries = [(t, f"INFO request {t}") for t in range(T0 - 300 * SEC, T0 + 3 * HOUR, 2 * SEC)]
+    with FakeLoki(entries) as fake:
+        monkeypatch.setattr(detector, "LOKI_URL", fake.url)
+        yield fake
+
+def test_pyramid_chunks_keep_one_row_per_fine_bucket(pyramid_loki):
+    features, _, source = train.load_baseline(T0, T0 + 3 * HOUR)
+    assert source == "loki"
+    # 360 fine buckets an hour; only the very last one is still open
+    assert features.shape[0] == 3 * 360 - 1
+
+def test_partial_feature_store_coverage_fetches_the_gaps(pyramid_loki, monkeypatch, tmp_path):
+    # T0 is long past the default retention
+    store = feature_store.FeatureStore(str(tmp_path), retention_days=100_000, context=detector.feature_context())
+    monkeypatch.setattr(detector, "_feature_store", store)
+    # the store only holds the last hour of the baseline
+    train.fetch_chunk_features(T0 + 2 * HOUR, T0 + 3 * HOUR)
+    n_requests = len(pyramid_loki.requests)
+    features, _, source = train.load_baseline(T0, T0 + 3 * HOUR)
+    assert source == "feature_store+loki"
+    assert features.shape[0] == 3 * 360 - 1
+    assert all(int(r["start"]) < T0 + 2 * HOUR for r in pyramid_loki.requests[n_requests:])
+    # the fetched chunks were stored, so the next run reads all of them from the store
+    n_requests = len(pyramid_loki.requests)
+    again, _, source = train.load_baseline(T0, T0 + 3 * HOUR)
+    assert source == "feature_store"
+    assert len(pyramid_loki.requests) == n_requests
+    assert np.array_equal(again, features)
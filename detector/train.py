@@ -0,0 +1,321 @@
+"""
+Train the detector model on a baseline period and publish it.
+
+The baseline is loaded a TRAIN_CHUNK_HOURS chunk at a time. A chunk's window
+features are read from the feature store when its rows for the current
+feature schema cover most of the chunk; otherwise the chunk's lines are
+fetched from Loki and featurized with the detector's current configuration
+(or, with FEATURE_SOURCE=logql, its metric features are queried) and stored.
+The fitted model — an IsolationForest, Half-Space Trees with
+DETECTOR_ENGINE=hst or the robust median/MAD + EWMA detector with
+DETECTOR_ENGINE=robust — is saved with its feature column names and the training
+window, and detector.py only scores with it from then on.
+
+The most recent TRAIN_VALIDATION_FRACTION of the baseline windows is held out:
+the model is fitted on the rest and the share of held-out windows it flags
+(against the share it flags on its own training windows) is recorded as the
+version's validation metrics. The model is published as a new version of the
+model registry (MODEL_REGISTRY_DIR, see model_store.py) and made current, or
+saved to MODEL_PATH when the registry is disabled. With TRAIN_ACTIVATE=0 it is
+only published, for a later `python model_store.py activate <version>`.
+
+IsolationForest trees are built on TRAIN_JOBS cores. With TRAIN_REFRESH=1 an
+existing forest for the same columns is not refitted: TRAIN_REFRESH_TREES new
+trees are grown on the new baseline (warm_start) and only the trees of the
+last TRAIN_TREE_GENERATIONS generations (the first fit is generation 0, each
+refresh the next one) are kept, so a refresh costs only the new trees and the
+forest keeps tracking recent behaviour.
+
+Run it as `python train.py` with the same environment as the detector, plus:
+ - TRAIN_START / TRAIN_END (ISO timestamps of the baseline period; default the
+   TRAIN_DAYS before now)
+ - TRAIN_DAYS (default 7)
+ - TRAIN_CHUNK_HOURS (lines are fetched and featurized this many hours at a time, default 24;
+   a chunk is cut short, with a warning, if it exceeds LOKI_MAX_LINES / LOKI_MAX_BYTES)
+ - TRAIN_STORE_MIN_COVERAGE (share of a chunk the feature store's rows must cover for the
+   chunk to be read from the store instead of Loki, default 0.9)
+ - TRAIN_ESTIMATORS (number of trees, default 100)
+ - TRAIN_JOBS (cores used to build trees, default -1: all)
+ - TRAIN_REFRESH (1 to grow the existing forest instead of refitting; default 0)
+ - TRAIN_REFRESH_TREES (trees added per refresh, default 25)
+ - TRAIN_TREE_GENERATIONS (generations of trees kept, default 4)
+ - TRAIN_VALIDATION_FRACTION (share of the newest baseline windows held out, default 0.2)
+ - TRAIN_ACTIVATE (1 to make the published version current, default 1)
+"""
+
+import os
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import dateutil.parser
+import detector
+import model_store
+
+TRAIN_START = os.environ.get("TRAIN_START")
+TRAIN_END = os.environ.get("TRAIN_END")
+TRAIN_DAYS = float(os.environ.get("TRAIN_DAYS", "7"))
+TRAIN_CHUNK_HOURS = float(os.environ.get("TRAIN_CHUNK_HOURS", "24"))
+TRAIN_ESTIMATORS = int(os.environ.get("TRAIN_ESTIMATORS", "100"))
+TRAIN_JOBS = int(os.environ.get("TRAIN_JOBS", "-1"))
+TRAIN_REFRESH = os.environ.get("TRAIN_REFRESH", "0") == "1"
+TRAIN_REFRESH_TREES = int(os.environ.get("TRAIN_REFRESH_TREES", "25"))
+TRAIN_TREE_GENERATIONS = int(os.environ.get("TRAIN_TREE_GENERATIONS", "4"))
+TRAIN_VALIDATION_FRACTION = float(os.environ.get("TRAIN_VALIDATION_FRACTION", "0.2"))
+TRAIN_ACTIVATE = os.environ.get("TRAIN_ACTIVATE", "1") == "1"
+TRAIN_STORE_MIN_COVERAGE = float(os.environ.get("TRAIN_STORE_MIN_COVERAGE", "0.9"))
+
+def _iso(ns):
+    return datetime.fromtimestamp(ns / 1e9, timezone.utc).isoformat()
+
+def _to_ns(dt):
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1e9)
+
+def baseline_range():
+    """
+    (start_ns, end_ns) of the baseline period.
+    """
+    end = dateutil.parser.isoparse(TRAIN_END) if TRAIN_END else datetime.now(timezone.utc)
+    start = dateutil.parser.isoparse(TRAIN_START) if TRAIN_START else end - timedelta(days=TRAIN_DAYS)
+    return _to_ns(start), _to_ns(end)
+
+def feature_names():
+    if detector.FEATURE_SOURCE == "logql":
+        return detector.BASIC_FEATURE_NAMES
+    return detector.get_feature_registry().names()
+
+def _margins_ns():
+    """
+    How much to fetch before and after a chunk: pyramid rows need the
+    coarsest level's history before them, and a time window or fine bucket is
+    only complete once a line past its end has been read.
+    """
+    if detector.WINDOW_MODE == "pyramid":
+        return detector.PYRAMID_LEVELS[-1] * 1_000_000_000, detector.PYRAMID_LEVELS[0] * 1_000_000_000
+    if detector.WINDOW_MODE == "time":
+        return 0, detector.WINDOW_SECONDS * 1_000_000_000
+    return 0, 0
+
+def _row_times(bounds):
+    """
+    The [start, end) time each feature row stands for: its window, except for
+    pyramid rows, whose bounds are those of the coarsest window behind the
+    row but which each advance by one fine bucket.
+    """
+    if detector.WINDOW_MODE == "pyramid" and len(bounds):
+        fine_ns = detector.PYRAMID_LEVELS[0] * 1_000_000_000
+        return np.column_stack([bounds[:, 1] - fine_ns, bounds[:, 1]])
+    return bounds
+
+def _coverage(bounds, lo, hi):
+    """
+    Share of [lo, hi) covered by the union of the rows' time spans.
+    """
+    times = np.clip(_row_times(bounds), lo, hi)
+    times = times[np.argsort(times[:, 0], kind="stable")]
+    if not len(times):
+        return 0.0
+    # merge overlapping spans: a span adds what lies past the furthest end before it
+    reach = np.maximum.accumulate(times[:, 1])
+    prev = np.r_[lo, reach[:-1]]
+    covered = np.maximum(times[:, 1] - np.maximum(times[:, 0], prev), 0).sum()
+    return covered / (hi - lo)
+
+def fetch_chunk_features(lo, hi):
+    """
+    Featurize the windows starting in [lo, hi) from Loki (lines, or metric
+    queries with FEATURE_SOURCE=logql) and keep them in the feature store for
+    the next training run. Returns (features, names).
+    """
+    names = feature_names()
+    if detector.FEATURE_SOURCE == "logql":
+        import logql_features
+        step_ns = logql_features.METRIC_STEP_SECONDS * 1_000_000_000
+        # split into queries Loki accepts (see logql_features.MAX_POINTS_PER_QUERY)
+        features, times = logql_features.build_metric_features(
+            detector.LOKI_URL, minutes=max(1, (hi - lo) // 60_000_000_000), end_s=hi // 1_000_000_000
+        )
+        bounds = np.column_stack([times * 1_000_000_000 - step_ns, times * 1_000_000_000]).astype(np.int64)
+    else:
+        budget = detector.FetchBudget()
+        before, after = _margins_ns()
+        batch = detector.fetch_loki('{job="app"}', lo - before, hi + after, budget=budget)
+        if budget.exhausted:
+            print(f"Warning: the chunk from {_iso(lo)} hit the Loki fetch budget (LOKI_MAX_LINES/LOKI_MAX_BYTES) "
+                  f"and was cut at {_iso(budget.cut_ns)}; lower TRAIN_CHUNK_HOURS to train on all of it.")
+        features, names, _ = detector.build_features(batch)
+        bounds = detector.feature_window_bounds(batch)
+    row_start = _row_times(bounds)[:, 0]
+    keep = (row_start >= lo) & (row_start < hi)
+    features, bounds = features[keep], bounds[keep]
+    detector.store_features(features, names, bounds)
+    return features, names
+
+def load_baseline(start_ns, end_ns):
+    """
+    Feature rows of the windows in [start_ns, end_ns), one TRAIN_CHUNK_HOURS
+    chunk at a time, so no more than a chunk of lines (within the fetch
+    budget) is in memory. A chunk is read from the feature store when its rows
+    cover at least TRAIN_STORE_MIN_COVERAGE of it, otherwise it is fetched
+    from Loki. Returns (features, names, source); source says which of the two
+    the rows came from.
+    """
+    names = feature_names()
+    store = detector.get_feature_store()
+    chunk_ns = int(TRAIN_CHUNK_HOURS * 3600 * 1e9)
+    rows, sources = [], {"feature_store": 0, "loki": 0}
+    for lo in range(start_ns, end_ns, chunk_ns):
+        hi = min(lo + chunk_ns, end_ns)
+        if store.enabled:
+            features, bounds = store.load(names, lo - _margins_ns()[0], hi)
+            row_start = _row_times(bounds)[:, 0]
+            keep = (row_start >= lo) & (row_start < hi)
+            features, bounds = features[keep], bounds[keep]
+            if _coverage(bounds, lo, hi) >= TRAIN_STORE_MIN_COVERAGE:
+                rows.append(np.asarray(features))
+                sources["feature_store"] += 1
+                continue
+        features, names = fetch_chunk_features(lo, hi)
+        rows.append(features)
+        sources["loki"] += 1
+    print(f"Baseline chunks: {sources['feature_store']} from the feature store, {sources['loki']} from Loki.")
+    source = "+".join(name for name, n in sources.items() if n) or "none"
+    if not rows:
+        return np.empty((0, len(names))), names, source
+    return np.concatenate(rows), names, source
+
+def train(features, names, meta=None):
+    """
+    Fit the DETECTOR_ENGINE model on baseline features; returns a model_store.TrainedModel.
+    """
+    if detector.DETECTOR_ENGINE == "hst":
+        import hstrees
+        model = hstrees.HalfSpaceTrees(contamination=detector.CONTAMINATION)
+    elif detector.DETECTOR_ENGINE == "robust":
+        import robust
+        model = robust.RobustDetector(contamination=detector.CONTAMINATION)
+    else:
+        from sklearn.ensemble import IsolationForest
+        model = IsolationForest(
+            n_estimators=TRAIN_ESTIMATORS, contamination=detector.CONTAMINATION, n_jobs=TRAIN_JOBS, random_state=42
+        )
+    model.fit(features)
+    meta = dict(meta or {}, generation=0, tree_generations=[0] * len(getattr(model, "estimators_", [])))
+    return model_store.TrainedModel(model, names, meta, detector.feature_context())
+
+def refresh(previous, features, meta=None):
+    """
+    Grow an existing IsolationForest on new baseline features: retire the trees
+    of the oldest generations, add TRAIN_REFRESH_TREES trees fitted on
+    `features` (warm_start), and recompute the score offset on them.
+    Returns a new model_store.TrainedModel.
+    """
+    model = previous.model
+    generation = previous.meta.get("generation", 0) + 1
+    tree_generations = list(previous.meta.get("tree_generations", [0] * len(model.estimators_)))
+    keep = [i for i, g in enumerate(tree_generations) if g > generation - TRAIN_TREE_GENERATIONS]
+    retired = len(tree_generations) - len(keep)
+    # trees are appended in fit order, so the retired ones are always a prefix
+    model.estimators_ = model.estimators_[retired:]
+    model.estimators_features_ = model.estimators_features_[retired:]
+    if len(getattr(model, "_seeds", ())) > len(model.estimators_):
+        model._seeds = model._seeds[-len(model.estimators_):] if model.estimators_ else model._seeds[:0]
+    # fit() recomputes the per-tree path-length arrays over all estimators and
+    # offset_ from `features`; a fresh seed keeps new trees from replaying old subsamples
+    model.set_params(
+        warm_start=True,
+        n_estimators=len(model.estimators_) + TRAIN_REFRESH_TREES,
+        n_jobs=TRAIN_JOBS,
+        random_state=42 + generation,
+    )
+    model.fit(features)
+    meta = dict(
+        meta or {},
+        generation=generation,
+        tree_generations=tree_generations[retired:] + [generation] * TRAIN_REFRESH_TREES,
+        retired_trees=retired,
+    )
+    return model_store.TrainedModel(model, previous.names, meta, previous.context)
+
+def validate(trained, fit_features, holdout):
+    """
+    Validation metrics of a model fitted on `fit_features` and checked on the
+    held-out windows that followed them.
+    """
+    metrics = {
+        "train_windows": int(fit_features.shape[0]),
+        "validation_windows": int(holdout.shape[0]),
+        "train_anomaly_rate": float(np.mean(trained.predict(fit_features) == -1)),
+    }
+    if holdout.shape[0]:
+        scores = trained.score_samples(holdout)
+        metrics["validation_anomaly_rate"] = float(np.mean(trained.predict(holdout) == -1))
+        metrics["validation_score_p1"] = float(np.percentile(scores, 1))
+        metrics["validation_score_p50"] = float(np.percentile(scores, 50))
+    return metrics
+
+def load_previous():
+    registry = model_store.ModelRegistry()
+    version = registry.current_version() if registry.enabled else None
+    if version:
+        try:
+            return registry.load(version)
+        except Exception as e:
+            print(f"Failed to load model version {version}:", e)
+            return None
+    return model_store.load_model()
+
+def main():
+    if detector.FEATURE_MODE == "templates":
+        print("Template-count features change shape with every new template; train.py supports FEATURE_MODE=basic only.")
+        return 1
+    start_ns, end_ns = baseline_range()
+    try:
+        features, names, source = load_baseline(start_ns, end_ns)
+    except Exception as e:
+        print("Failed to load baseline features:", e)
+        return 1
+    period = f"{_iso(start_ns)} .. {_iso(end_ns)}"
+    if features.shape[0] < 3:
+        print(f"Only {features.shape[0]} baseline windows in {period}; not training.")
+        return 1
+    # windows come in time order, so the holdout is the newest part of the baseline
+    n_holdout = int(features.shape[0] * TRAIN_VALIDATION_FRACTION)
+    if features.shape[0] - n_holdout < 3:
+        n_holdout = 0
+    features, holdout = features[:features.shape[0] - n_holdout], features[features.shape[0] - n_holdout:]
+    meta = {
+        "train_start_ns": start_ns,
+        "train_end_ns": end_ns,
+        "n_windows": int(features.shape[0]),
+        "source": source,
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+    }
+    previous = load_previous() if TRAIN_REFRESH else None
+    t0 = time.perf_counter()
+    if previous is not None and detector.DETECTOR_ENGINE == "iforest" and previous.matches(names, detector.feature_context()) and hasattr(previous.model, "estimators_"):
+        trained = refresh(previous, features, meta)
+        print(f"Refreshed forest to generation {trained.meta['generation']}: "
+              f"+{TRAIN_REFRESH_TREES} trees, {trained.meta['retired_trees']} retired, {len(trained.model.estimators_)} total.")
+    else:
+        trained = train(features, names, meta)
+    elapsed = time.perf_counter() - t0
+    trained.meta["train_seconds"] = elapsed
+    trained.meta["engine"] = detector.DETECTOR_ENGINE
+    metrics = validate(trained, features, holdout)
+    print(f"Trained on {features.shape[0]} windows from {source} ({period}) in {elapsed:.2f}s; "
+          f"flags {metrics['train_anomaly_rate']:.1%} of them and {metrics.get('validation_anomaly_rate', 0.0):.1%} "
+          f"of {metrics['validation_windows']} held-out windows.")
+    registry = model_store.ModelRegistry()
+    if registry.enabled:
+        version = registry.publish(trained, metrics, activate=TRAIN_ACTIVATE)
+        state = "current" if TRAIN_ACTIVATE else "not activated"
+        print(f"Published model {version} to {registry.directory} ({state}).")
+    else:
+        model_store.save_model(trained)
+        print(f"Saved model to {model_store.MODEL_PATH}.")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
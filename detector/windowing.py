@@ -0,0 +1,150 @@
+"""
+Vectorized per-line columns and sliding-window aggregation over a LogBatch.
+
+Per-line values (length, substring flags) are computed once as NumPy arrays
+straight from the batch's UTF-8 buffer; every window's sum is then the
+difference of two prefix sums, so featurizing costs O(n) regardless of
+WINDOW_SIZE / WINDOW_STEP.
+"""
+
+import numpy as np
+import logformat
+
+def window_bounds(n, size, step):
+    """
+    Start and (exclusive) end line index of every sliding window over n lines,
+    matching range(0, max(1, n - size + 1), max(1, step)).
+    """
+    starts = np.arange(0, max(1, n - size + 1), max(1, step), dtype=np.int64)
+    ends = np.minimum(starts + size, n)
+    return starts, ends
+
+def next_window_start(n, size, step):
+    """
+    Line index where the window after the last complete one would start; lines
+    from here on are needed to finish the current partial window.
+    """
+    if n < size:
+        return 0
+    step = max(1, step)
+    return ((n - size) // step) * step + step
+
+def time_window_bounds(ts, width_ns, hop_ns):
+    """
+    Line index bounds of epoch-aligned time windows [t, t + width_ns) started every
+    hop_ns, found with np.searchsorted over the sorted int64 timestamps. Only
+    windows that have fully elapsed (ending at or before the last timestamp) are
+    returned. Returns (starts, ends, window_start_ns, next_start_index).
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if not len(ts):
+        return empty, empty, empty, 0
+    first = int(ts[0]) - int(ts[0]) % hop_ns
+    last = int(ts[-1])
+    n_windows = (last - width_ns - first) // hop_ns + 1 if last - width_ns >= first else 0
+    t = first + hop_ns * np.arange(n_windows, dtype=np.int64)
+    starts = np.searchsorted(ts, t, side="left")
+    ends = np.searchsorted(ts, t + width_ns, side="left")
+    next_start = int(np.searchsorted(ts, first + hop_ns * n_windows, side="left"))
+    return starts, ends, t, next_start
+
+def prefix_sum(values):
+    out = np.zeros(len(values) + 1, dtype=np.result_type(values.dtype, np.int64))
+    np.cumsum(values, out=out[1:])
+    return out
+
+def window_sums(values, starts, ends):
+    """
+    Sum of values[s:e] for every window, from one prefix sum.
+    """
+    cs = prefix_sum(values)
+    return cs[ends] - cs[starts]
+
+def window_quantiles(values, starts, ends, qs):
+    """
+    (n_windows, len(qs)) percentiles qs (0-100, linear interpolation as
+    np.percentile) of values[starts[k]:ends[k]] per window, ignoring NaN; NaN
+    for windows without values. All windows are sorted together in one lexsort.
+    """
+    out = np.full((len(starts), len(qs)), np.nan)
+    present = ~np.isnan(values)
+    kept = values[present]
+    cs = prefix_sum(present)
+    lo, sizes = cs[starts], cs[ends] - cs[starts]
+    if not len(kept) or not sizes.sum():
+        return out
+    base = np.cumsum(sizes) - sizes
+    window = np.repeat(np.arange(len(starts)), sizes)
+    member = np.arange(int(sizes.sum())) - np.repeat(base - lo, sizes)
+    ranked = kept[member][np.lexsort((kept[member], window))]
+    filled = sizes > 0
+    for j, q in enumerate(qs):
+        h = q / 100.0 * (sizes[filled] - 1)
+        below = np.floor(h).astype(np.int64)
+        above = np.minimum(below + 1, sizes[filled] - 1)
+        a, b = ranked[base[filled] + below], ranked[base[filled] + above]
+        out[filled, j] = a + (b - a) * (h - below)
+    return out
+
+def char_lengths(batch):
+    """
+    Length of every line in characters (what len(str) returns), counted from the
+    UTF-8 buffer: byte length minus the continuation bytes inside the line.
+    """
+    lengths = np.diff(batch.offsets)
+    cont = np.flatnonzero((batch.data & 0xC0) == 0x80)
+    if len(cont):
+        line = np.searchsorted(batch.offsets, cont, side="right") - 1
+        lengths = lengths - np.bincount(line, minlength=len(lengths))
+    return lengths
+
+def find_all(data, pattern, candidates=None):
+    """
+    Start positions of every occurrence of the byte string `pattern` in `data`.
+    Candidates (positions of the first byte, computed here unless given) are
+    narrowed byte by byte.
+    """
+    m = len(pattern)
+    pos = np.flatnonzero(data == pattern[0]) if candidates is None else candidates
+    pos = pos[pos <= len(data) - m]
+    for k in range(1, m):
+        pos = pos[data[pos + k] == pattern[k]]
+    return pos
+
+def contains_any(batch, patterns):
+    """
+    Boolean per line: does the line contain any of `patterns` (str)? Equivalent
+    to `any(p in line for p in patterns)` for every line.
+    """
+    flags = np.zeros(len(batch), dtype=bool)
+    if not len(batch):
+        return flags
+    first_bytes = {}
+    for p in patterns:
+        raw = p.encode("utf-8")
+        # patterns sharing a first byte share one scan of the buffer
+        if raw[0] not in first_bytes:
+            first_bytes[raw[0]] = np.flatnonzero(batch.data == raw[0])
+        pos = find_all(batch.data, raw, first_bytes[raw[0]])
+        if not len(pos):
+            continue
+        line = np.searchsorted(batch.offsets, pos, side="right") - 1
+        inside = pos + len(raw) <= batch.offsets[line + 1]
+        flags[line[inside]] = True
+    return flags
+
+def severity_flags(batch):
+    """
+    Per-line (is_error, is_warn) booleans. Lines in the app's log format are
+    classified by their parsed level (ERROR/CRITICAL, WARNING); only the other
+    lines fall back to substring search for "ERROR"/"Error" and "WARN"/"Warning".
+    """
+    level = logformat.level_codes(batch)
+    errors = level >= logformat.LEVEL_ERROR
+    warns = level == logformat.LEVEL_WARNING
+    unparsed = np.flatnonzero(level == logformat.LEVEL_UNPARSED)
+    if len(unparsed):
+        rest = batch if len(unparsed) == len(batch) else batch.take(unparsed)
+        errors[unparsed] = contains_any(rest, ("ERROR", "Error"))
+        warns[unparsed] = contains_any(rest, ("WARN", "Warning"))
+    return errors, warns